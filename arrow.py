@@ -1,11 +1,36 @@
 #!/usr/bin/env python3
 import sys
 import os
+import argparse
+import json
 from interpreter.parser import parse, desugar, group_statements
-from interpreter.core import rewrite
+from interpreter.core import rewrite, run
+from interpreter import (aio, checkpoint, closures, compiler, memreport, network, output, profile, sharding,
+                         threads, trace, transpiler)
+from interpreter.memo import EvalCache
+from interpreter.scheduler import Scheduler
 
-def run_arrow_file(filepath):
+ENGINES = {
+    "rewrite": rewrite,
+    "stack": run,
+    "vm": compiler.run,
+    "closure": closures.run,
+    "python": transpiler.run,
+    "async": aio.run,
+    "sharded": sharding.run,
+    "threads": threads.run,
+    "network": network.run,
+}
+
+def run_arrow_file(filepath, engine="stack", memo=False, options=None, checkpoint_every=None,
+                   checkpoint_file=None, trace_file=None, profile_json=None, profiling=False,
+                   mem_every=None):
     try:
+        if engine == "python":
+            # Transpiled modules are cached next to the source file.
+            transpiler.cached_module(filepath).main(None, output.sink)
+            return True
+
         with open(filepath, 'r') as f:
             code = f.read()
             
@@ -16,24 +41,229 @@ def run_arrow_file(filepath):
         
         # Execute the code
         initial_state = ["program", grouped_ast, "env", {}, "done", False]
-        final_state = rewrite(initial_state)
+        if mem_every:
+            cache = EvalCache() if memo else None
+            report = memreport.MemoryReport(mem_every)
+            try:
+                final_state = memreport.run(initial_state, report, cache=cache)
+            finally:
+                print(report.report(), file=sys.stderr)
+            if memo:
+                print(f"memo: {cache.stats()}", file=sys.stderr)
+        elif profiling:
+            cache = EvalCache() if memo else None
+            stats = profile.Profile()
+            final_state = profile.run(initial_state, stats, cache=cache)
+            print(stats.report(), file=sys.stderr)
+            if profile_json:
+                with open(profile_json, "w") as f:
+                    json.dump(stats.to_json(), f, indent=1)
+            if memo:
+                print(f"memo: {cache.stats()}", file=sys.stderr)
+        elif trace_file:
+            cache = EvalCache() if memo else None
+            final_state = trace.record(initial_state, trace_file, cache=cache)
+            if memo:
+                print(f"memo: {cache.stats()}", file=sys.stderr)
+        elif checkpoint_every:
+            cache = EvalCache() if memo else None
+            final_state = checkpoint.run(initial_state, checkpoint_file or filepath + ".ckpt",
+                                         checkpoint_every, cache)
+            if memo:
+                print(f"memo: {cache.stats()}", file=sys.stderr)
+        elif memo:
+            cache = EvalCache()
+            final_state = run(initial_state, cache=cache)
+            print(f"memo: {cache.stats()}", file=sys.stderr)
+        else:
+            final_state = ENGINES[engine](initial_state, **(options or {}))
         
+        return True
+    except Exception as e:
+        output.flush()
+        print(f"Error: {e}")
+        return False
+
+def resume_arrow_file(path, checkpoint_every=None, memo=False):
+    try:
+        cache = EvalCache() if memo else None
+        checkpoint.resume(path, checkpoint_every, cache)
+        if memo:
+            print(f"memo: {cache.stats()}", file=sys.stderr)
+        return True
+    except Exception as e:
+        output.flush()
+        print(f"Error: {e}")
+        return False
+
+def load_state(filepath):
+    with open(filepath, 'r') as f:
+        code = f.read()
+    return ["program", group_statements(desugar(parse(code))), "env", {}, "done", False]
+
+def run_arrow_files(filepaths, quantum=1000, max_steps=None):
+    # Runs every program in this process, interleaved by the scheduler.
+    sched = Scheduler(quantum)
+    ok = True
+    for filepath in filepaths:
+        try:
+            sched.add(load_state(filepath), filepath, max_steps=max_steps)
+        except Exception as e:
+            print(f"Error in {filepath}: {e}")
+            ok = False
+    for job in sched.run():
+        if job.error is not None:
+            print(f"Error in {job.name}: {job.error}")
+            ok = False
+    return ok
+
+def emit_python(filepath):
+    try:
+        with open(filepath, 'r') as f:
+            code = f.read()
+        grouped_ast = group_statements(desugar(parse(code)))
+        sys.stdout.write(transpiler.transpile(grouped_ast, os.path.basename(filepath)))
         return True
     except Exception as e:
         print(f"Error: {e}")
         return False
 
 def main():
-    if len(sys.argv) < 2:
+    parser = argparse.ArgumentParser(prog="arrow", usage="arrow [options] <filename.ar> [more.ar ...]")
+    parser.add_argument("filepaths", nargs="*")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="stack",
+                        help="execution engine (default: stack)")
+    parser.add_argument("--emit-python", action="store_true",
+                        help="print the program transpiled to Python instead of running it")
+    parser.add_argument("--memo", action="store_true",
+                        help="memoize value evaluation (stack engine) and report hit/miss counts")
+    parser.add_argument("--workers", type=int,
+                        help="worker processes (sharded engine) or threads (threads engine)")
+    parser.add_argument("--deterministic", action="store_true",
+                        help="sharded engine: run in lockstep rounds with reproducible output order")
+    parser.add_argument("--registry",
+                        help="network engine: HOST:PORT of the actor registry (default: none, local actors only)")
+    parser.add_argument("--listen", default="127.0.0.1:0",
+                        help="network engine: HOST:PORT to accept messages on (default: any free port)")
+    parser.add_argument("--linger", type=float, default=1.0,
+                        help="network engine: seconds without work before the node exits")
+    parser.add_argument("--checkpoint-every", type=int, metavar="N",
+                        help="stack engine: save a checkpoint every N statements")
+    parser.add_argument("--checkpoint-file", metavar="FILE",
+                        help="where checkpoints go (default: <filename.ar>.ckpt)")
+    parser.add_argument("--resume", metavar="FILE",
+                        help="continue the program saved in a checkpoint file")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="stack engine: record every step to FILE for python -m interpreter.trace")
+    parser.add_argument("--profile", action="store_true",
+                        help="stack engine: report statement and actor counts and times on stderr")
+    parser.add_argument("--profile-json", metavar="FILE",
+                        help="with --profile, also write the profile to FILE as JSON")
+    parser.add_argument("--mem-report", action="store_true",
+                        help="stack engine: sample env, actor and program sizes and report them on stderr")
+    parser.add_argument("--mem-every", type=int, default=memreport.EVERY, metavar="N",
+                        help=f"with --mem-report, statements between samples (default: {memreport.EVERY})")
+    parser.add_argument("--output", default="stdout", metavar="SINK",
+                        help="where @print output goes: stdout (default), null, or a file path")
+    parser.add_argument("--quantum", type=int, default=1000,
+                        help="statements each program runs per turn when several files are given")
+    parser.add_argument("--max-steps", type=int,
+                        help="stop any program that runs more statements than this (several files)")
+    args = parser.parse_args()
+
+    try:
+        sink = output.open_sink(args.output)
+    except OSError as e:
+        print(f"Error: cannot write output to '{args.output}': {e.strerror}.")
+        return
+    with output.use(sink):
+        run_args(args)
+
+def run_args(args):
+    if args.checkpoint_every is not None and args.checkpoint_every < 1:
+        print("Error: --checkpoint-every must be at least 1.")
+        return
+    if (args.checkpoint_every or args.resume) and args.engine != "stack":
+        print("Error: checkpoints require the stack engine.")
+        return
+    if args.trace and (args.engine != "stack" or args.checkpoint_every or args.resume):
+        print("Error: --trace requires the stack engine, without checkpoints.")
+        return
+    if args.profile_json and not args.profile:
+        print("Error: --profile-json requires --profile.")
+        return
+    if args.profile and (args.engine != "stack" or args.checkpoint_every or args.resume or args.trace):
+        print("Error: --profile requires the stack engine, without checkpoints or --trace.")
+        return
+    if args.mem_report and (args.engine != "stack" or args.checkpoint_every or args.resume or args.trace
+                            or args.profile):
+        print("Error: --mem-report requires the stack engine, without checkpoints, --trace or --profile.")
+        return
+    if args.mem_every < 1:
+        print("Error: --mem-every must be at least 1.")
+        return
+
+    if args.resume:
+        if not os.path.exists(args.resume):
+            print(f"Error: File '{args.resume}' not found.")
+            return
+        resume_arrow_file(args.resume, args.checkpoint_every, args.memo)
+        return
+
+    if not args.filepaths:
         print("Usage: arrow <filename.ar>")
         return
-        
-    filepath = sys.argv[1]
-    if not os.path.exists(filepath):
-        print(f"Error: File '{filepath}' not found.")
+
+    for filepath in args.filepaths:
+        if not os.path.exists(filepath):
+            print(f"Error: File '{filepath}' not found.")
+            return
+
+    if len(args.filepaths) > 1:
+        if (args.emit_python or args.memo or args.trace or args.profile or args.mem_report
+                or args.engine != "stack"):
+            print("Error: several files can only be run together on the stack engine.")
+            return
+        if args.quantum < 1:
+            print("Error: --quantum must be at least 1.")
+            return
+        run_arrow_files(args.filepaths, args.quantum, args.max_steps)
+        return
+
+    filepath = args.filepaths[0]
+
+    if args.emit_python:
+        emit_python(filepath)
         return
         
-    run_arrow_file(filepath)
+    if args.memo and args.engine != "stack":
+        print("Error: --memo requires the stack engine.")
+        return
+
+    options = None
+    if args.engine == "sharded":
+        options = {"workers": args.workers, "deterministic": args.deterministic}
+    elif args.engine == "threads" and not args.deterministic:
+        options = {"threads": args.workers}
+    elif args.engine == "network" and args.workers is None and not args.deterministic:
+        try:
+            registry = None
+            if args.registry is not None:
+                host, port = args.registry.rsplit(":", 1)
+                registry = (host, int(port))
+            listen_host, listen_port = args.listen.rsplit(":", 1)
+            options = {"registry": registry, "host": listen_host,
+                       "port": int(listen_port), "linger": args.linger}
+        except ValueError:
+            print("Error: --registry and --listen take HOST:PORT.")
+            return
+    elif args.workers is not None or args.deterministic:
+        print("Error: --workers and --deterministic require the sharded engine.")
+        return
+
+    run_arrow_file(filepath, args.engine, args.memo, options, args.checkpoint_every,
+                   args.checkpoint_file, args.trace, args.profile_json, args.profile,
+                   args.mem_every if args.mem_report else None)
 
 if __name__ == "__main__":
     main()
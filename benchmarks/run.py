@@ -0,0 +1,149 @@
+"""
+Benchmark runner: times every phase of running the generated workloads.
+
+    python benchmarks/run.py                     # everything, compared to baseline.json
+    python benchmarks/run.py --quick counter     # smallest size of some workloads
+    python benchmarks/run.py --save              # store the results as the baseline
+    python benchmarks/run.py --json results.json --engine vm
+
+Each case is a workload at one size, and reports the best of --repeat
+runs for each phase: parse, desugar, group_statements and run (the
+chosen engine; rewrite is too slow for most sizes). Parse-only workloads
+also report MB/s. Program output is discarded.
+
+A case is a regression when a phase takes more than --threshold longer
+than in the baseline (and at least a millisecond longer); the runner then
+exits with status 1. Baselines are specific to the machine that made
+them, so store one with --save before changing the code.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from interpreter.core import rewrite, run  # noqa: E402
+from interpreter.parser import desugar, group_statements, parse  # noqa: E402
+from interpreter import closures, compiler, output  # noqa: E402
+from workloads import PARSE_ONLY, WORKLOADS  # noqa: E402
+
+ENGINES = {"stack": run, "rewrite": rewrite, "vm": compiler.run, "closure": closures.run}
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def run_case(source, engine, parse_only, repeat):
+    best = {}
+    for _ in range(repeat):
+        phases = {}
+        ast, phases["parse"] = timed(parse, source)
+        if not parse_only:
+            ast, phases["desugar"] = timed(desugar, ast)
+            prog, phases["group_statements"] = timed(group_statements, ast)
+            state = ["program", prog, "env", {}, "done", False]
+            with output.use(output.NullSink()):
+                _, phases["run"] = timed(ENGINES[engine], state)
+        for phase, seconds in phases.items():
+            best[phase] = min(best.get(phase, seconds), seconds)
+    result = {"bytes": len(source.encode("utf-8")), "seconds": best}
+    if parse_only:
+        result["parse_mb_per_s"] = result["bytes"] / 1e6 / best["parse"]
+    return result
+
+
+def compare(results, baseline, threshold):
+    # Prints each phase against the baseline; returns the regressions.
+    regressions = []
+    for case, result in results.items():
+        old = baseline.get(case)
+        if old is None:
+            continue
+        for phase, seconds in result["seconds"].items():
+            before = old["seconds"].get(phase)
+            if before is None:
+                continue
+            ratio = seconds / before if before else float("inf")
+            slower = ratio > 1 + threshold and seconds - before > 1e-3
+            flag = "  REGRESSION" if slower else ""
+            print(f"  {case:24} {phase:17} {before:9.4f}s -> {seconds:9.4f}s  x{ratio:.2f}{flag}")
+            if slower:
+                regressions.append((case, phase))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Arrow benchmark suite.")
+    parser.add_argument("workloads", nargs="*", help=f"workloads to run (default: all of {', '.join(WORKLOADS)})")
+    parser.add_argument("--quick", action="store_true", help="only the smallest size of each workload")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the best is kept")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="stack")
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline to compare against")
+    parser.add_argument("--save", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown counted as a regression")
+    args = parser.parse_args()
+
+    names = args.workloads or list(WORKLOADS)
+    for name in names:
+        if name not in WORKLOADS:
+            print(f"Error: unknown workload '{name}'.")
+            return 2
+
+    results = {}
+    for name in names:
+        generate, sizes = WORKLOADS[name]
+        for size in sizes[:1] if args.quick else sizes:
+            case = f"{name}-{size}"
+            result = run_case(generate(size), args.engine, name in PARSE_ONLY, args.repeat)
+            results[case] = result
+            phases = "  ".join(f"{phase} {seconds:.4f}s" for phase, seconds in result["seconds"].items())
+            extra = f"  ({result['parse_mb_per_s']:.2f} MB/s)" if "parse_mb_per_s" in result else ""
+            print(f"{case:24} {phases}{extra}", flush=True)
+
+    report = {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "engine": args.engine,
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+
+    status = 0
+    if args.save:
+        # Keep the baseline's other cases when only some were run.
+        saved = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                saved = json.load(f)["results"]
+        saved.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(dict(report, results=saved), f, indent=1)
+        print(f"baseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("engine") != args.engine:
+            print(f"baseline was made with the {baseline.get('engine')} engine, not comparing")
+        else:
+            print(f"\ncompared to {args.baseline}:")
+            regressions = compare(results, baseline["results"], args.threshold)
+            if regressions:
+                print(f"{len(regressions)} regressions")
+                status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
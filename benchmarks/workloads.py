@@ -0,0 +1,107 @@
+"""
+Generated Arrow programs for the benchmark suite.
+
+Every workload is a function from one size parameter to program source,
+listed in WORKLOADS with the sizes the suite runs it at (the first size
+is the one --quick uses).
+"""
+
+
+def counter(n):
+    # test.ar with an n-character unary number: n loop iterations.
+    return f'''
+"" > data
+"{"a" * n}" > number
+[
+  "step" => [
+    ["always" > @print]
+    [[data "a"] > data]
+    [data > @count]
+  ]
+  [number] => [
+    ["done" > @print]
+  ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def match_cases(n):
+    # An actor with n literal patterns, sent 10,000 messages spread over
+    # its cases, one in ten of them matching nothing.
+    cases = "\n".join(f'  "k{i}" => [[[hits "a"] > hits]]' for i in range(n))
+    sends = "\n".join(
+        f'"miss{j}" > @table' if j % 10 == 9 else f'"k{j * 7919 % n}" > @table' for j in range(10_000)
+    )
+    return f'"" > hits\n[\n{cases}\n] > table\n{sends}\n'
+
+
+def deep_nesting(depth):
+    # A chain of depth actors, each sending on before its own statement
+    # runs, so every message nests depth blocks deep. About 20,000 steps.
+    lines = ['"" > n']
+    for i in range(depth - 1):
+        lines.append(f'[ "x" => [ ["x" > @d{i + 1}] [[n "a"] > n] ] ] > d{i}')
+    lines.append(f'[ "x" => [ [[n "a"] > n] ] ] > d{depth - 1}')
+    lines.extend('"x" > @d0' for _ in range(max(1, 10_000 // depth)))
+    return "\n".join(lines) + "\n"
+
+
+def fan_out(width):
+    # An actor whose unmatched messages queue width commands; about
+    # 100,000 commands in all.
+    commands = " ".join(f'"a" > o{k}' for k in range(width))
+    sends = "\n".join('"go" > @fan' for _ in range(max(1, 100_000 // width)))
+    return f'[ "never" => [["x" > y]] {commands} ] > fan\n{sends}\n'
+
+
+def huge_string(doublings):
+    # A string doubled `doublings` times, then 5,000 small appends to
+    # another one, which are not all the same character.
+    lines = ['"ab" > s']
+    lines.extend("[s s] > s" for _ in range(doublings))
+    lines.append('"" > t')
+    lines.append('"" > n')
+    lines.append(f'"{"a" * 5000}" > limit')
+    lines.append(
+        '[ "step" => [ [[t "xyz"] > t] [[n "a"] > n] [n > @grow] ] [limit] => [ [t > u] ] "step" > @grow ] > grow'
+    )
+    lines.append('"step" > @grow')
+    return "\n".join(lines) + "\n"
+
+
+def flat(n):
+    # n independent assignments.
+    return "\n".join(f'"v{i}" > x{i % 100}' for i in range(n)) + "\n"
+
+
+def parse_source(megabytes):
+    # About `megabytes` MB of mixed source, only parsed.
+    parts = []
+    size = 0
+    i = 0
+    while size < megabytes * 1_000_000:
+        part = (
+            f'"v{i}" > x{i}\n'
+            f'[ "k{i}" => [ [[x{i} "a"] > x{i}] [x{i} > @p{i}] ] [x{i}] => [ ["done" > @print] ] ] > p{i}\n'
+            f'"k{i}" > @p{i}  # comment {i}\n'
+        )
+        parts.append(part)
+        size += len(part)
+        i += 1
+    return "".join(parts)
+
+
+WORKLOADS = {
+    "counter": (counter, [1_000, 10_000, 100_000]),
+    "match_cases": (match_cases, [10, 100, 1_000, 10_000]),
+    "deep_nesting": (deep_nesting, [10, 100, 1_000]),
+    "fan_out": (fan_out, [10, 100, 1_000]),
+    "huge_string": (huge_string, [16, 20, 24]),
+    "flat": (flat, [1_000, 10_000, 100_000]),
+    "parse": (parse_source, [0.1, 1.0]),
+}
+
+# Workloads whose programs are only parsed, to measure throughput.
+PARSE_ONLY = {"parse"}
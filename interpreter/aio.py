@@ -0,0 +1,139 @@
+"""
+Asyncio runtime where every actor has its own mailbox and task.
+
+A send `x > @actor` evaluates x and enqueues it on the actor's mailbox
+without waiting. The actor's task takes messages in arrival order and runs
+the matched block itself, or the actor's commands when nothing matches.
+Sends made inside those blocks are enqueued as well, so actors make
+progress side by side instead of being spliced into one program. All tasks
+share the program's env, and every `yield_every` statements the runtime
+hands control back to the event loop, so a busy program never blocks the
+other coroutines of the service it runs in.
+
+    await run_async(state)          # inside a running event loop
+    run(state)                      # from synchronous code
+
+Messages to one actor are handled in the order they were sent; how output
+from different actors interleaves depends on scheduling.
+"""
+import asyncio
+
+from interpreter import output
+from interpreter.core import (
+    eval_value,
+    lookup_actor_commands,
+    match_actor,
+    store_actor_command,
+    store_actor_pattern,
+)
+from interpreter.values import text
+
+
+class Runtime:
+    def __init__(self, env, yield_every=100, write=None):
+        self.env = env
+        self.yield_every = yield_every
+        self.write = write or output.sink.write
+        self.mailboxes = {}
+        self.tasks = {}
+        # Messages enqueued but not yet handled; the run is over once the
+        # program has finished and this drops to zero.
+        self.outstanding = 0
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.error = None
+        self.budget = yield_every
+
+    def send(self, name, val):
+        node = self.env.get((name,))
+        if not node or node[0] != "matchcases":
+            # Not an actor: the message is dropped, as under step().
+            return
+        box = self.mailboxes.get(name)
+        if box is None:
+            box = self.mailboxes[name] = asyncio.Queue()
+            self.tasks[name] = asyncio.ensure_future(self.serve(name, box))
+        self.outstanding += 1
+        self.idle.clear()
+        box.put_nowait(val)
+
+    async def serve(self, name, box):
+        while True:
+            val = await box.get()
+            try:
+                match = match_actor(self.env, [name], val)
+                if match is not None:
+                    block = match[1]
+                    if not (isinstance(block, list) and block and isinstance(block[0], list)):
+                        block = [block]
+                else:
+                    block = list(lookup_actor_commands(self.env, [name]) or [])
+                await self.execute(block)
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+                self.idle.set()
+                return
+            self.done(1)
+
+    def done(self, n):
+        # n messages have been handled.
+        self.outstanding -= n
+        if not self.outstanding:
+            self.idle.set()
+
+    async def execute(self, block):
+        env = self.env
+        for stmt in block:
+            self.budget -= 1
+            if not self.budget:
+                self.budget = self.yield_every
+                await asyncio.sleep(0)
+            A, op, B = stmt[0], stmt[1], stmt[2]
+            if op != ">":
+                continue
+            if isinstance(A, list) and any(
+                isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+            ):
+                for sub in A:
+                    if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+                        pat, _, res = sub
+                        store_actor_pattern(env, B, [pat, res])
+                    elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+                        store_actor_command(env, B, sub)
+            elif isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+                val = eval_value(A, env)
+                if B[1] == "print":
+                    self.write(text(val) + "\n")
+                else:
+                    self.send(B[1], val)
+            else:
+                env[tuple(B)] = eval_value(A, env)
+
+    async def shutdown(self):
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+
+
+async def run_async(state, yield_every=100, write=None):
+    # Coroutine counterpart of core.run(); returns once the program and every
+    # message it caused have been handled.
+    if state[5]:
+        return state
+    runtime = Runtime(state[3], yield_every, write)
+    try:
+        await runtime.execute(state[1])
+        while runtime.outstanding and runtime.error is None:
+            await runtime.idle.wait()
+    finally:
+        await runtime.shutdown()
+        output.flush()
+    if runtime.error is not None:
+        raise runtime.error
+    state[1], state[5] = [], True
+    return state
+
+
+def run(state, yield_every=100, write=None):
+    return asyncio.run(run_async(state, yield_every, write))
@@ -0,0 +1,413 @@
+"""
+Binary checkpoints of a running program, for the stack engine.
+
+A checkpoint file starts with MAGIC and holds a sequence of records:
+
+    kind (b"S" full snapshot, b"D" delta) | u32 length | u32 crc32 | payload
+
+A payload is the step count, the done flag, the continuation (frames and
+tail, see core.load()) and env entries: every entry in a snapshot, only
+the ones that changed since the previous record in a delta. Every
+FULL_EVERY records the file is rewritten with a fresh snapshot, so it
+stays bounded while the records in between are small appends.
+
+Values are encoded with one byte tags. Strings are interned: the first
+occurrence since the last snapshot carries the text and later ones refer
+to it by number. Lists are deduplicated by identity in the same way, so
+statements shared by the program, actor definitions and frames are
+written once. Ropes keep their runs, so unary numbers stay small, and
+ropes extended from one another share their runs list (see values.Rope),
+so only the runs added since the list was last written are written. Actor
+nodes are written as their patterns and commands; the dispatch index is
+rebuilt after resuming.
+
+A record cut short by a crash fails its length or checksum check, and
+resuming uses the records before it.
+"""
+import os
+import struct
+import zlib
+from collections import deque
+
+from interpreter import output
+from interpreter.core import execute, load, new_node, pending
+from interpreter.values import Rope
+
+MAGIC = b"ARCK\x01"
+RECORD = struct.Struct(">II")
+
+# Records between full snapshots.
+FULL_EVERY = 16
+
+STR, NEWSTR, LIST, REF, ROPE, NODE, TUPLE, INT, NONE, DICT, SET = range(11)
+
+
+def put_varint(out, n):
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def get_varint(buf, pos):
+    n = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def is_node(value):
+    return isinstance(value, list) and len(value) >= 2 and value[0] == "matchcases"
+
+
+def node_signature(value):
+    # Nodes grow in place, so an unchanged object may still need writing.
+    if is_node(value):
+        return len(value[1]), len(value[2]) if len(value) > 2 else 0
+    return None
+
+
+class Writer:
+    def __init__(self, path, full_every=FULL_EVERY):
+        self.path = path
+        self.full_every = full_every
+        self.file = None
+        self.deltas = 0
+
+    def reset(self):
+        self.strings = {}
+        # id(list) -> (number, list, length); the list is kept alive so its
+        # id cannot be reused. A list that has grown since is written again
+        # under a new number.
+        self.objects = {}
+        self.numbered = 0
+        # id(runs) -> [number, runs, entries written] for rope runs lists.
+        self.bases = {}
+        # key -> (value, signature) as of the last record.
+        self.seen = {}
+        # The last record's hamt.Map, for a persistent env.
+        self.previous = None
+
+    def put(self, out, x):
+        if type(x) is str:
+            n = self.strings.get(x)
+            if n is None:
+                self.strings[x] = len(self.strings)
+                data = x.encode("utf-8")
+                out.append(NEWSTR)
+                put_varint(out, len(data))
+                out += data
+            else:
+                out.append(STR)
+                put_varint(out, n)
+        elif type(x) is list:
+            entry = self.objects.get(id(x))
+            if entry is not None and entry[2] == len(x):
+                out.append(REF)
+                put_varint(out, entry[0])
+                return
+            self.objects[id(x)] = (self.numbered, x, len(x))
+            self.numbered += 1
+            out.append(LIST)
+            put_varint(out, len(x))
+            for item in x:
+                self.put(out, item)
+        elif type(x) is Rope:
+            # The runs list (0 for none, else its number + 1), the entries
+            # of it not written before, then n, last, count and length.
+            out.append(ROPE)
+            if not x.n:
+                out.append(0)
+            else:
+                base = self.bases.get(id(x.runs))
+                if base is None:
+                    base = self.bases[id(x.runs)] = [len(self.bases), x.runs, 0]
+                put_varint(out, base[0] + 1)
+                new = x.runs[base[2] : x.n]
+                put_varint(out, len(new))
+                for text, count in new:
+                    self.put(out, text)
+                    put_varint(out, count)
+                base[2] += len(new)
+            put_varint(out, x.n)
+            self.put(out, x.last)
+            put_varint(out, x.count)
+            put_varint(out, x.length)
+        elif type(x) is tuple:
+            out.append(TUPLE)
+            put_varint(out, len(x))
+            for item in x:
+                self.put(out, item)
+        elif type(x) is int:
+            out.append(INT)
+            put_varint(out, x * 2 if x >= 0 else -x * 2 - 1)
+        elif x is None:
+            out.append(NONE)
+        elif type(x) is dict:
+            out.append(DICT)
+            put_varint(out, len(x))
+            for key, item in x.items():
+                self.put(out, key)
+                self.put(out, item)
+        elif type(x) is set:
+            out.append(SET)
+            put_varint(out, len(x))
+            for item in x:
+                self.put(out, item)
+        else:
+            raise Exception(f"cannot checkpoint a {type(x).__name__}")
+
+    def put_entry(self, out, value):
+        if is_node(value):
+            out.append(NODE)
+            for part in (value[1], value[2] if len(value) > 2 else []):
+                put_varint(out, len(part))
+                for item in part:
+                    self.put(out, item)
+        else:
+            self.put(out, value)
+
+    def payload(self, cont, env, steps, done):
+        # Env entries changed since the last payload; all of them after
+        # reset().
+        out = bytearray()
+        put_varint(out, steps)
+        out.append(1 if done else 0)
+        frames, tail = cont
+        put_varint(out, len(frames))
+        for block, i in frames:
+            self.put(out, block)
+            put_varint(out, i)
+        put_varint(out, len(tail))
+        for stmt in tail:
+            self.put(out, stmt)
+        if hasattr(env, "snapshot"):
+            # A persistent env replaces whatever it changes, actor nodes
+            # included, so only the subtrees that differ need comparing.
+            current = env.snapshot()
+            keys = current if self.previous is None else current.diff(self.previous)
+            changed = [(key, current.get(key)) for key in keys]
+            self.previous = current
+        else:
+            changed = []
+            for key, value in env.items():
+                signature = node_signature(value)
+                old = self.seen.get(key)
+                if old is None or old[0] is not value or old[1] != signature:
+                    self.seen[key] = (value, signature)
+                    changed.append((key, value))
+        put_varint(out, len(changed))
+        for key, value in changed:
+            self.put(out, key)
+            self.put_entry(out, value)
+        return out
+
+    def write(self, cont, env, steps, done):
+        full = self.file is None or self.deltas >= self.full_every
+        if full:
+            self.reset()
+        out = self.payload(cont, env, steps, done)
+        record = (b"S" if full else b"D") + RECORD.pack(len(out), zlib.crc32(out)) + out
+        if full:
+            if self.file is not None:
+                self.file.close()
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(MAGIC + record)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.file = open(self.path, "ab")
+            self.deltas = 0
+        else:
+            self.file.write(record)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.deltas += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class Reader:
+    def __init__(self):
+        self.strings = []
+        self.objects = []
+        self.bases = []
+
+    def get(self, buf, pos):
+        tag = buf[pos]
+        pos += 1
+        if tag == STR:
+            n, pos = get_varint(buf, pos)
+            return self.strings[n], pos
+        if tag == NEWSTR:
+            n, pos = get_varint(buf, pos)
+            s = bytes(buf[pos : pos + n]).decode("utf-8")
+            self.strings.append(s)
+            return s, pos + n
+        if tag == LIST:
+            n, pos = get_varint(buf, pos)
+            x = []
+            self.objects.append(x)
+            for _ in range(n):
+                item, pos = self.get(buf, pos)
+                x.append(item)
+            return x, pos
+        if tag == REF:
+            n, pos = get_varint(buf, pos)
+            return self.objects[n], pos
+        if tag == ROPE:
+            base, pos = get_varint(buf, pos)
+            if not base:
+                runs = []
+            else:
+                if base > len(self.bases):
+                    self.bases.append([])
+                runs = self.bases[base - 1]
+                k, pos = get_varint(buf, pos)
+                for _ in range(k):
+                    text, pos = self.get(buf, pos)
+                    count, pos = get_varint(buf, pos)
+                    runs.append((text, count))
+            n, pos = get_varint(buf, pos)
+            last, pos = self.get(buf, pos)
+            count, pos = get_varint(buf, pos)
+            length, pos = get_varint(buf, pos)
+            return Rope(runs, n, last, count, length), pos
+        if tag == NODE:
+            parts = []
+            for _ in range(2):
+                n, pos = get_varint(buf, pos)
+                part = []
+                for _ in range(n):
+                    item, pos = self.get(buf, pos)
+                    part.append(item)
+                parts.append(part)
+            return new_node(parts[0], parts[1]), pos
+        if tag == TUPLE or tag == SET:
+            n, pos = get_varint(buf, pos)
+            items = []
+            for _ in range(n):
+                item, pos = self.get(buf, pos)
+                items.append(item)
+            return (tuple(items) if tag == TUPLE else set(items)), pos
+        if tag == INT:
+            n, pos = get_varint(buf, pos)
+            return (n >> 1 if not n & 1 else -(n >> 1) - 1), pos
+        if tag == NONE:
+            return None, pos
+        if tag == DICT:
+            n, pos = get_varint(buf, pos)
+            x = {}
+            for _ in range(n):
+                key, pos = self.get(buf, pos)
+                x[key], pos = self.get(buf, pos)
+            return x, pos
+        raise Exception(f"bad checkpoint tag {tag}")
+
+    def read_state(self, payload, env):
+        # Decodes a Writer.payload() into env; returns (cont, steps, done).
+        steps, pos = get_varint(payload, 0)
+        done = bool(payload[pos])
+        pos += 1
+        n, pos = get_varint(payload, pos)
+        frames = []
+        for _ in range(n):
+            block, pos = self.get(payload, pos)
+            i, pos = get_varint(payload, pos)
+            frames.append([block, i])
+        n, pos = get_varint(payload, pos)
+        tail = deque()
+        for _ in range(n):
+            stmt, pos = self.get(payload, pos)
+            tail.append(stmt)
+        n, pos = get_varint(payload, pos)
+        for _ in range(n):
+            key, pos = self.get(payload, pos)
+            env[key], pos = self.get(payload, pos)
+        return [frames, tail], steps, done
+
+
+def read_records(data):
+    # Complete, intact records after the last full snapshot.
+    if bytes(data[: len(MAGIC)]) != MAGIC:
+        raise Exception("not an arrow checkpoint file")
+    records = []
+    pos = len(MAGIC)
+    header = 1 + RECORD.size
+    while pos + header <= len(data):
+        kind = data[pos : pos + 1]
+        length, crc = RECORD.unpack_from(data, pos + 1)
+        payload = data[pos + header : pos + header + length]
+        if kind not in (b"S", b"D") or len(payload) != length or zlib.crc32(payload) != crc:
+            break
+        if kind == b"S":
+            records = []
+        records.append(payload)
+        pos += header + length
+    if not records:
+        raise Exception("checkpoint file holds no complete snapshot")
+    return records
+
+
+def read(path):
+    """The (cont, env, steps, done) saved last in a checkpoint file."""
+    with open(path, "rb") as f:
+        data = memoryview(f.read())
+    reader = Reader()
+    env = {}
+    for payload in read_records(data):
+        cont, steps, done = reader.read_state(payload, env)
+    return cont, env, steps, done
+
+
+def execute_checkpointed(cont, env, path, every, steps=0, cache=None, full_every=FULL_EVERY):
+    # core.execute() to completion, saving a checkpoint every `every` steps
+    # and once more at the end. Returns the total step count.
+    writer = Writer(path, full_every)
+    try:
+        while True:
+            n = execute(cont, env, every, cache)
+            steps += n
+            done = n < every
+            # What was printed before a checkpoint is not printed again
+            # after resuming from it.
+            output.flush()
+            writer.write(cont, env, steps, done)
+            if done:
+                return steps
+    finally:
+        output.flush()
+        writer.close()
+
+
+def run(state, path, every, cache=None, full_every=FULL_EVERY):
+    # Same interface as core.run(), with checkpoints.
+    if state[5]:
+        return state
+    cont = load(state[1])
+    execute_checkpointed(cont, state[3], path, every, 0, cache, full_every)
+    state[1], state[5] = [], True
+    return state
+
+
+def resume(path, every=None, cache=None, full_every=FULL_EVERY):
+    """Continue the program saved in a checkpoint file and return its final
+    state, still checkpointing to the same file if `every` is given."""
+    cont, env, steps, done = read(path)
+    if not done:
+        if every:
+            steps = execute_checkpointed(cont, env, path, every, steps, cache, full_every)
+        else:
+            try:
+                execute(cont, env, None, cache)
+            finally:
+                output.flush()
+    return ["program", pending(cont), "env", env, "done", True]
@@ -0,0 +1,265 @@
+"""
+Closure-compilation backend.
+
+Each [A, ">", B] statement is turned into a Python closure at load time,
+bound to the run's env, tail queue and output stream. Literal-only values
+become prebuilt constants, variable reads become direct dict lookups and
+@print becomes a bound write, so executing a statement is a single call.
+A closure returns the block a matched send splices in, or None.
+
+Actor definitions store ordinary core nodes in the env, so the env can be
+handed to any other engine afterwards; the compiled cases and command blocks
+of each node are kept per actor key alongside the run.
+"""
+import sys
+import time
+from collections import deque
+
+from interpreter import output
+from interpreter.core import (
+    assigned_keys,
+    coalesce,
+    rewrite,
+    store_actor_command,
+    store_actor_pattern,
+)
+from interpreter.values import text
+
+
+def compile_program(prog, env, tail, write):
+    # Statements of actors already in the env can run too.
+    actors = [value[1:] for value in env.values() if is_node(value)]
+    written = assigned_keys([prog, actors], env)
+    # Per actor key: [node, cases, blocks], the compiled forms of node[1] and
+    # node[2], brought up to date whenever the node has grown or changed.
+    compiled = {}
+
+    def compile_block(stmts):
+        return [fn for fn in map(compile_statement, stmts) if fn is not None]
+
+    def compile_result(res):
+        if isinstance(res, list) and res and isinstance(res[0], list):
+            return compile_block(res)
+        return compile_block([res])
+
+    def compile_value(A):
+        # Returns (constant, None) or (None, thunk).
+        leaves = []
+        todo = [A]
+        while todo:
+            node = todo.pop()
+            if isinstance(node, list):
+                todo.extend(reversed(node))
+            else:
+                leaves.append(node)
+        # Literal leaves get the key None, which is never bound, so every
+        # part is read with the same env.get(key, default).
+        parts = [
+            ((leaf,), [leaf])
+            if isinstance(leaf, str) and (leaf,) in written
+            else (None, [leaf])
+            for leaf in leaves
+        ]
+        if all(key is None for key, _ in parts):
+            value = []
+            for _, part in parts:
+                value.extend(part)
+            return coalesce(value), None
+        get = env.get
+        if len(parts) == 1:
+            key, default = parts[0]
+            return None, lambda: get(key, default)
+
+        def thunk():
+            result = []
+            for key, default in parts:
+                result.extend(get(key, default))
+            return coalesce(result)
+
+        return None, thunk
+
+    def compile_statement(stmt):
+        try:
+            A, op, B = stmt[0], stmt[1], stmt[2]
+        except (IndexError, KeyError, TypeError) as e:
+            return compile_failure(e)
+        if op != ">":
+            return None
+        if isinstance(A, list) and any(
+            isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+        ):
+            return compile_definition(A, B)
+        const, thunk = compile_value(A)
+        if isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+            if B[1] == "print":
+                return compile_print(const, thunk)
+            return compile_send((B[1],), const, thunk)
+        try:
+            key = tuple(B)
+            hash(key)
+        except TypeError as e:
+            return compile_failure(e)
+        if thunk is None:
+            def store():
+                env[key] = const
+        else:
+            def store():
+                env[key] = thunk()
+        return store
+
+    def compile_failure(error):
+        # Malformed statements raise when they run, as they do under step().
+        def fail():
+            raise error
+        return fail
+
+    def compile_definition(A, B):
+        try:
+            key = tuple(B)
+            hash(key)
+        except TypeError as e:
+            return compile_failure(e)
+        entry = actor_entry(key)
+        actions = []
+        for sub in A:
+            if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+                actions.append((1, store_actor_pattern, sub[::2], compile_case(sub[::2])))
+            elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+                actions.append((2, store_actor_command, sub, compile_block([sub])))
+
+        def define():
+            for kind, store, item, done in actions:
+                store(env, B, item)
+                node = env[key]
+                # Anything else is caught up by refresh() on the next send.
+                if entry[0] is node and len(entry[kind]) == len(node[kind]) - 1:
+                    entry[kind].append(done)
+
+        return define
+
+    def compile_case(patres):
+        const, thunk = compile_value(patres[0])
+        return const, thunk, compile_result(patres[1])
+
+    def actor_entry(key):
+        entry = compiled.get(key)
+        if entry is None:
+            entry = compiled[key] = [None, [], []]
+        return entry
+
+    def refresh(entry, node):
+        if entry[0] is not node:
+            entry[:] = [node, [], []]
+        cases, blocks = entry[1], entry[2]
+        for patres in node[1][len(cases) :]:
+            cases.append(compile_case(patres))
+        if len(node) >= 3:
+            for cmd in node[2][len(blocks) :]:
+                blocks.append(compile_block([cmd]))
+
+    def compile_print(const, thunk):
+        if thunk is None:
+            line = text(const) + "\n"
+
+            def emit():
+                write(line)
+        else:
+            def emit():
+                write(text(thunk()) + "\n")
+        return emit
+
+    def compile_send(key, const, thunk):
+        get = env.get
+        entry = actor_entry(key)
+
+        def send():
+            val = const if thunk is None else thunk()
+            node = get(key)
+            if node and node[0] == "matchcases":
+                if entry[0] is not node or len(entry[1]) != len(node[1]):
+                    refresh(entry, node)
+                for pconst, pthunk, block in entry[1]:
+                    if (pconst if pthunk is None else pthunk()) == val:
+                        return block
+                if len(node) >= 3 and node[2]:
+                    if len(entry[2]) != len(node[2]):
+                        refresh(entry, node)
+                    tail.extend(entry[2])
+            return None
+
+        return send
+
+    return compile_block(prog)
+
+
+def is_node(value):
+    return isinstance(value, list) and len(value) >= 2 and value[0] == "matchcases"
+
+
+def execute(block, tail):
+    frames = [[block, 0]]
+    while True:
+        if frames:
+            frame = frames[-1]
+        elif tail:
+            frame = [tail.popleft(), 0]
+            frames.append(frame)
+        else:
+            return
+        block, i = frame
+        n = len(block)
+        while i < n:
+            spliced = block[i]()
+            i += 1
+            if spliced is not None:
+                if i == n:
+                    # Tail send: reuse the finished frame.
+                    frame[0], frame[1] = spliced, 0
+                else:
+                    frame[1] = i
+                    frames.append([spliced, 0])
+                break
+        else:
+            frames.pop()
+
+
+def run(state, write=None):
+    # Same interface as core.run(); output goes to `write` (default: the
+    # current output sink).
+    if state[5]:
+        return state
+    tail = deque()
+    block = compile_program(state[1], state[3], tail, write or output.sink.write)
+    try:
+        execute(block, tail)
+    finally:
+        output.flush()
+    state[1], state[5] = [], True
+    return state
+
+
+# --- BENCHMARK ---
+if __name__ == "__main__":
+    import io
+    from interpreter.parser import desugar, group_statements, parse
+
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    code = f"""
+        "" > data
+        "{"a" * n}" > number
+        [
+          "step" => [[[data "a"] > data] [data > @count]]
+          [number] => [["done" > @print]]
+          "step" > @count
+        ] > count
+        "step" > @count
+    """
+    for name, engine in [("rewrite", rewrite), ("closure", run)]:
+        state = ["program", group_statements(desugar(parse(code))), "env", {}, "done", False]
+        out, sys.stdout = sys.stdout, io.StringIO()
+        start = time.perf_counter()
+        try:
+            engine(state)
+        finally:
+            sys.stdout = out
+        print(f"{name:8s} {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,354 @@
+"""
+Bytecode compiler and VM for grouped Arrow ASTs.
+
+The grouped AST is lowered once into flat lists of (opcode, arg) pairs, so
+the per-statement shape checks step() performs happen at load time, and
+every env key is resolved to an integer slot so the VM keeps variables in a
+flat list. The VM keeps the same continuation layout as core.execute(): a
+stack of [code, pc] frames followed by a tail queue of appended commands.
+
+Actor nodes in the slots are ordinary core nodes, so a state can move
+between this engine and the others. The compiled form of their patterns
+and commands is kept on the side, per slot, and compiled on first use
+for nodes defined elsewhere.
+"""
+from collections import deque
+
+from interpreter import output
+from interpreter.core import assigned_keys, coalesce, new_node
+from interpreter.values import text
+
+LOAD_LIT = 0
+LOAD_NAME = 1
+CONCAT = 2
+STORE = 3
+SEND = 4
+PRINT = 5
+DEFINE_PATTERN = 6
+DEFINE_COMMAND = 7
+FAIL = 8
+
+OPNAMES = [
+    "LOAD_LIT",
+    "LOAD_NAME",
+    "CONCAT",
+    "STORE",
+    "SEND",
+    "PRINT",
+    "DEFINE_PATTERN",
+    "DEFINE_COMMAND",
+    "FAIL",
+]
+
+
+class Scope:
+    # Name resolution for one program: every env key the code touches gets
+    # an integer slot, and `names` maps slots back to keys for debugging
+    # and for writing the slots back into a dict env.
+    def __init__(self, written):
+        self.written = written
+        self.slots = {}
+        self.names = []
+
+    def slot(self, key):
+        i = self.slots.get(key)
+        if i is None:
+            i = self.slots[key] = len(self.names)
+            self.names.append(key)
+        return i
+
+
+def compile_program(prog, env=None):
+    """Compile a grouped program into VM code; returns (code, scope)."""
+    # Statements of actors already in the env can run too.
+    actors = [value[1:] for value in (env or {}).values() if is_node(value)]
+    scope = Scope(assigned_keys([prog, actors], env))
+    return compile_block(prog, scope), scope
+
+
+def is_node(value):
+    return isinstance(value, list) and len(value) >= 2 and value[0] == "matchcases"
+
+
+def compile_block(stmts, scope):
+    code = []
+    for stmt in stmts:
+        compile_statement(stmt, scope, code)
+    return code
+
+
+def compile_statement(stmt, scope, code):
+    try:
+        A, op, B = stmt[0], stmt[1], stmt[2]
+    except (IndexError, KeyError, TypeError) as e:
+        code.append((FAIL, e))
+        return
+    if op != ">":
+        return
+    if isinstance(A, list) and any(
+        isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+    ):
+        try:
+            actor = scope.slot(tuple(B))
+        except TypeError as e:
+            code.append((FAIL, e))
+            return
+        for sub in A:
+            if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+                pat, _, res = sub
+                patres = [pat, res]
+                code.append((DEFINE_PATTERN, (actor, patres, compile_case(patres, scope))))
+            elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+                code.append((DEFINE_COMMAND, (actor, sub, compile_block([sub], scope))))
+        return
+    code.extend(compile_expr(A, scope))
+    if isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+        if B[1] == "print":
+            code.append((PRINT, None))
+            return
+        key = (B[1],)
+        op = SEND
+    else:
+        key = B
+        op = STORE
+    try:
+        code.append((op, scope.slot(tuple(key))))
+    except TypeError as e:
+        code.append((FAIL, e))
+
+
+def compile_case(patres, scope):
+    # [const, None, block] for a constant pattern, else [None, code, block].
+    pat, res = patres
+    if isinstance(res, list) and res and isinstance(res[0], list):
+        block = compile_block(res, scope)
+    else:
+        block = compile_block([res], scope)
+    pattern = compile_expr(pat, scope)
+    if len(pattern) == 1 and pattern[0][0] == LOAD_LIT:
+        return [pattern[0][1], None, block]
+    return [None, pattern, block]
+
+
+def compile_expr(A, scope):
+    # Mirrors eval_value(): a list evaluates to the coalesced concatenation
+    # of its leaves, a name to its binding or itself. Names the program never
+    # writes are literals, and an expression made only of literals is folded
+    # into a single constant.
+    if not isinstance(A, list):
+        return [load_leaf(A, scope)]
+    leaves = []
+    todo = [A]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, list):
+            todo.extend(reversed(node))
+        else:
+            leaves.append(load_leaf(node, scope))
+    if all(op == LOAD_LIT for op, _ in leaves):
+        value = []
+        for _, part in leaves:
+            value.extend(part)
+        return [(LOAD_LIT, coalesce(value))]
+    if len(leaves) == 1:
+        return leaves
+    return leaves + [(CONCAT, len(leaves))]
+
+
+def load_leaf(leaf, scope):
+    # LOAD_NAME carries the literal to use while the slot is unset.
+    if isinstance(leaf, str) and (leaf,) in scope.written:
+        return (LOAD_NAME, (scope.slot((leaf,)), [leaf]))
+    return (LOAD_LIT, [leaf])
+
+
+def evaluate(code, slots):
+    # Run a pattern expression: only LOAD_LIT, LOAD_NAME and CONCAT.
+    stack = []
+    for op, arg in code:
+        if op == LOAD_NAME:
+            value = slots[arg[0]]
+            stack.append(arg[1] if value is None else value)
+        elif op == LOAD_LIT:
+            stack.append(arg)
+        else:
+            result = []
+            for part in stack[-arg:]:
+                result.extend(part)
+            del stack[-arg:]
+            stack.append(coalesce(result))
+    return stack.pop()
+
+
+class Actors:
+    # Compiled cases and commands of the actor node in each slot, as
+    # (patterns, cases) and (commands, blocks) pairs. A pair is extended
+    # when its node has more items than were compiled, and rebuilt when the
+    # slot holds another node.
+    def __init__(self, scope, slots, env):
+        self.scope = scope
+        self.slots = slots
+        self.env = env
+        self.cases = [None] * len(slots)
+        self.commands = [None] * len(slots)
+
+    def compiled(self, table, i, items, compile_item):
+        entry = table[i]
+        if entry is None or entry[0] is not items:
+            entry = table[i] = (items, [])
+        done = entry[1]
+        if len(done) < len(items):
+            # Defined outside this VM: compile the rest now.
+            for item in items[len(done) :]:
+                done.append(compile_item(item))
+            self.grow()
+        return done
+
+    def cases_of(self, i):
+        return self.compiled(self.cases, i, self.slots[i][1], lambda patres: compile_case(patres, self.scope))
+
+    def commands_of(self, i):
+        node = self.slots[i]
+        if len(node) < 3:
+            node.append([])
+        return self.compiled(self.commands, i, node[2], lambda cmd: compile_block([cmd], self.scope))
+
+    def grow(self):
+        # Compiling may have given more keys slots.
+        for key in self.scope.names[len(self.slots) :]:
+            self.slots.append(self.env.get(key))
+            self.cases.append(None)
+            self.commands.append(None)
+
+    def define(self, i, kind, item, compiled):
+        # store_actor_pattern() / store_actor_command() on a slot.
+        node = self.slots[i]
+        if node is None or node[0] != "matchcases":
+            self.slots[i] = node = new_node([], [])
+        done = self.cases_of(i) if kind == 1 else self.commands_of(i)
+        node[kind].append(item)
+        done.append(compiled)
+
+
+def execute(code, slots, actors):
+    # Variables live in `slots`, a flat list indexed by Scope slot, with
+    # None for keys that have not been written yet.
+    frames = [[code, 0]]
+    tail = deque()
+    stack = []
+    push = stack.append
+    pop = stack.pop
+    cases_in = actors.cases
+    while True:
+        if frames:
+            frame = frames[-1]
+        elif tail:
+            frame = [tail.popleft(), 0]
+            frames.append(frame)
+        else:
+            return
+        code, pc = frame
+        n = len(code)
+        while pc < n:
+            op, arg = code[pc]
+            pc += 1
+            if op == LOAD_NAME:
+                value = slots[arg[0]]
+                push(arg[1] if value is None else value)
+            elif op == LOAD_LIT:
+                push(arg)
+            elif op == CONCAT:
+                result = []
+                for part in stack[-arg:]:
+                    result.extend(part)
+                del stack[-arg:]
+                push(coalesce(result))
+            elif op == SEND:
+                val = pop()
+                node = slots[arg]
+                if node and node[0] == "matchcases":
+                    target = None
+                    pats = node[1]
+                    entry = cases_in[arg]
+                    if entry is None or entry[0] is not pats or len(entry[1]) != len(pats):
+                        cases = actors.cases_of(arg)
+                    else:
+                        cases = entry[1]
+                    for const, pattern, block in cases:
+                        if const is None:
+                            const = evaluate(pattern, slots)
+                        if const == val:
+                            target = block
+                            break
+                    if target is not None:
+                        if pc == n:
+                            # Tail send: reuse the finished frame.
+                            frame[0], frame[1] = target, 0
+                        else:
+                            frame[1] = pc
+                            frames.append([target, 0])
+                        break
+                    if len(node) >= 3 and node[2]:
+                        tail.extend(actors.commands_of(arg))
+            elif op == STORE:
+                slots[arg] = pop()
+            elif op == PRINT:
+                output.sink.write(text(pop()) + "\n")
+            elif op == DEFINE_PATTERN:
+                actors.define(arg[0], 1, arg[1], arg[2])
+            elif op == DEFINE_COMMAND:
+                actors.define(arg[0], 2, arg[1], arg[2])
+            else:
+                raise arg
+        else:
+            frames.pop()
+
+
+def run(state):
+    # Same interface as core.run(): compiles the state's program and runs it
+    # to completion. The state's dict env is loaded into slots up front and
+    # written back afterwards.
+    if state[5]:
+        return state
+    env = state[3]
+    code, scope = compile_program(state[1], env)
+    slots = [None] * len(scope.names)
+    for key, i in scope.slots.items():
+        if key in env:
+            slots[i] = env[key]
+    try:
+        execute(code, slots, Actors(scope, slots, env))
+    finally:
+        output.flush()
+        for key, value in zip(scope.names, slots):
+            if value is not None:
+                env[key] = value
+    state[1], state[5] = [], True
+    return state
+
+
+def disassemble(code, names=None, indent=""):
+    # `names` is Scope.names, used to label slots.
+    def label(i):
+        return f"{i} ({names[i]!r})" if names else str(i)
+
+    lines = []
+    for op, arg in code:
+        if op == DEFINE_PATTERN:
+            const, pattern, block = arg[2]
+            lines.append(f"{indent}DEFINE_PATTERN {label(arg[0])}")
+            if pattern is None:
+                lines.append(f"{indent}  pattern LOAD_LIT {const!r}")
+            else:
+                lines.append(disassemble(pattern, names, indent + "  pattern "))
+            lines.append(disassemble(block, names, indent + "    "))
+        elif op == DEFINE_COMMAND:
+            lines.append(f"{indent}DEFINE_COMMAND {label(arg[0])}")
+            lines.append(disassemble(arg[2], names, indent + "    "))
+        elif op == LOAD_NAME:
+            lines.append(f"{indent}LOAD_NAME {label(arg[0])}")
+        elif op in (STORE, SEND):
+            lines.append(f"{indent}{OPNAMES[op]} {label(arg)}")
+        else:
+            lines.append(f"{indent}{OPNAMES[op]} {arg!r}")
+    return "\n".join(line for line in lines if line)
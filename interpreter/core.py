@@ -1,3 +1,9 @@
+from collections import deque
+
+from interpreter import output
+from interpreter.values import Rope, concat, text
+
+
 def step(state):
     # state = ["program", prog, "env", env, "done", done]
     prog, env, done = state[1], state[3], state[5]
@@ -26,55 +32,187 @@ def step(state):
                 val = eval_value(A, env)
                 actor_name = B[1]
                 if actor_name == "print":
-                    print("".join(val))
+                    output.sink.write(text(val) + "\n")
                 else:
-                    pats = lookup_actor_patterns(env, [actor_name])
-                    cmds = lookup_actor_commands(env, [actor_name])
-                    matched = False
-                    if pats:
-                        for pat, result in pats:
-                            if eval_value(pat, env) == val:
-                                matched = True
-                                # If result is a list of statements, expand
-                                if (
-                                    isinstance(result, list)
-                                    and result
-                                    and isinstance(result[0], list)
-                                ):
-                                    rest = result + rest
-                                else:
-                                    rest = [result] + rest
-                                break
-                    if cmds and not matched:
-                        for cmd in cmds:
-                            rest = rest+[cmd]
+                    match = match_actor(env, [actor_name], val)
+                    if match is not None:
+                        result = match[1]
+                        # If result is a list of statements, expand
+                        if (
+                            isinstance(result, list)
+                            and result
+                            and isinstance(result[0], list)
+                        ):
+                            rest = result + rest
+                        else:
+                            rest = [result] + rest
+                    else:
+                        cmds = lookup_actor_commands(env, [actor_name])
+                        if cmds:
+                            for cmd in cmds:
+                                rest = rest+[cmd]
             else:
                 env[tuple(B)] = eval_value(A, env)  
 
     state[1], state[3] = rest, env
     return state, True
 
-def rewrite(state):
-    while True:
-        state, changed = step(state)
-        if not changed:
-            return state
+def rewrite(state, hooks=None):
+    if hooks:
+        # The hooked loop runs the same statements in the same order.
+        return run(state, hooks=hooks)
+    try:
+        while True:
+            state, changed = step(state)
+            if not changed:
+                return state
+    finally:
+        output.flush()
+
+def load(prog):
+    # A continuation for the stack engine: a stack of [block, index] frames,
+    # top of stack first, followed by a tail queue of appended commands.
+    return [[[prog, 0]], deque()]
+
+def pending(cont):
+    # Flatten a continuation back into the program list rewrite() would hold.
+    frames, tail = cont
+    prog = []
+    for block, i in reversed(frames):
+        prog.extend(block[i:])
+    prog.extend(tail)
+    return prog
+
+def finished(cont):
+    # Whether no statements are left, without flattening the continuation.
+    frames, tail = cont
+    return not tail and all(i >= len(block) for block, i in frames)
+
+def execute(cont, env, limit=None, cache=None):
+    # Same statement semantics and ordering as step(), but taking the next
+    # statement and splicing a match result in front of the rest are O(1):
+    # results are pushed as new frames instead of copied onto the program.
+    # Runs at most `limit` statements and returns how many were executed.
+    # With a memo.EvalCache, values are memoized and every env write is
+    # reported to it. Printed output is flushed before returning.
+    frames, tail = cont
+    evaluate = eval_value if cache is None else cache.eval
+    steps = 0
+    if limit is None:
+        limit = -1
+    while steps != limit:
+        if frames:
+            frame = frames[-1]
+            block, i = frame
+            if i >= len(block):
+                frames.pop()
+                continue
+            stmt = block[i]
+            frame[1] = i + 1
+        elif tail:
+            stmt = tail.popleft()
+            frame = None
+        else:
+            break
+        steps += 1
+        A, op, B = stmt[0], stmt[1], stmt[2]
+        if op != ">":
+            continue
+        if isinstance(A, list) and any(
+            isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+        ):
+            for sub in A:
+                if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+                    pat, _, res = sub
+                    store_actor_pattern(env, B, [pat, res])
+                elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+                    store_actor_command(env, B, sub)
+            if cache is not None:
+                cache.touch(tuple(B))
+        elif isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+            val = evaluate(A, env)
+            actor_name = B[1]
+            if actor_name == "print":
+                output.sink.write(text(val) + "\n")
+            else:
+                match = match_actor(env, [actor_name], val, evaluate)
+                if match is not None:
+                    result = match[1]
+                    if not (
+                        isinstance(result, list)
+                        and result
+                        and isinstance(result[0], list)
+                    ):
+                        result = [result]
+                    if frame is not None and frame[1] == len(frame[0]):
+                        # Tail send: the current block has nothing left, so
+                        # reuse its frame and loops run in constant space.
+                        frame[0], frame[1] = result, 0
+                    else:
+                        frames.append([result, 0])
+                else:
+                    cmds = lookup_actor_commands(env, [actor_name])
+                    if cmds:
+                        tail.extend(cmds)
+        else:
+            key = tuple(B)
+            env[key] = evaluate(A, env)
+            if cache is not None:
+                cache.touch(key)
+    output.flush()
+    return steps
+
+def run(state, limit=None, cache=None, hooks=None):
+    # Drop-in replacement for rewrite() backed by execute(). With a limit the
+    # state is left resumable: its program holds whatever has not run yet.
+    # With registered hooks (see hooks.Hooks) the hooked copy of the loop
+    # runs instead.
+    if state[5]:
+        return state
+    cont = load(state[1])
+    try:
+        if hooks:
+            hooks.execute(cont, state[3], limit, cache)
+        else:
+            execute(cont, state[3], limit, cache)
+    finally:
+        output.flush()
+    state[1] = pending(cont)
+    state[5] = not state[1]
+    return state
+
+def own_node(env, key):
+    # The actor node at key, safe to change in place. A persistent env
+    # (hamt.Env) may share it with a fork or snapshot, and copies it first.
+    return env[key] if type(env) is dict else env.own(key)
+
+class Actor(list):
+    # A matchcases node, ["matchcases", patterns, commands], carrying its
+    # dispatch index as an attribute rather than an item: a program that
+    # reads the actor's name as a value only sees the three items.
+    __slots__ = ("index",)
+
+def new_node(patterns, commands):
+    node = Actor(("matchcases", patterns, commands))
+    node.index = new_index()
+    return node
 
 def store_actor_pattern(env, actor, patres):
     key = tuple(actor)
     if key not in env or env[key][0] != "matchcases":
-        env[key] = ["matchcases", [patres], []]
+        env[key] = new_node([patres], [])
     else:
-        env[key][1].append(patres)
+        own_node(env, key)[1].append(patres)
 
 def store_actor_command(env, actor, command):
     key = tuple(actor)
     if key not in env or env[key][0] != "matchcases":
-        env[key] = ["matchcases", [], [command]]
+        env[key] = new_node([], [command])
     else:
-        if len(env[key]) < 3:
-            env[key].append([])
-        env[key][2].append(command)
+        node = own_node(env, key)
+        if len(node) < 3:
+            node.append([])
+        node[2].append(command)
 
 def lookup_actor_patterns(env, actor):
     node = env.get(tuple(actor))
@@ -88,27 +226,127 @@ def lookup_actor_commands(env, actor):
         return node[2]
     return None
 
+def new_index():
+    # Dispatch index of an Actor node: [table, dynamic, shapes, indexed, env_size, names]. `table` maps the
+    # value of each literal pattern (one whose names are all unbound) to the
+    # position of its first occurrence, `dynamic` lists the positions of
+    # patterns that must be evaluated at send time, `shapes` holds the item
+    # lengths of the table keys so most misses skip hashing the message, and
+    # `names` are the names the literal patterns rely on staying unbound.
+    return [{}, [], set(), 0, -1, set()]
+
+def match_actor(env, actor, val, evaluate=None):
+    # The first [pat, result] of the actor whose pattern evaluates to val,
+    # or None. Same answer as scanning lookup_actor_patterns() in order.
+    if evaluate is None:
+        evaluate = eval_value
+    node = env.get(tuple(actor))
+    if not node or node[0] != "matchcases":
+        return None
+    pats = node[1]
+    if type(node) is not Actor:
+        # A plain ["matchcases", ...] list, such as a copy of an actor read
+        # as a value, has no index.
+        for patres in pats:
+            if evaluate(patres[0], env) == val:
+                return patres
+        return None
+    if type(env) is not dict:
+        node = own_node(env, tuple(actor))
+    index = refresh_index(env, node.index, pats)
+    first = len(pats)
+    try:
+        if tuple(map(len, val)) in index[2]:
+            first = index[0].get(tuple(val), first)
+    except TypeError:
+        pass
+    for i in index[1]:
+        if i > first:
+            break
+        if evaluate(pats[i][0], env) == val:
+            return pats[i]
+    if first < len(pats):
+        return pats[first]
+    return None
+
+def refresh_index(env, index, pats):
+    # Env keys are never removed, so a literal pattern can only stop being
+    # literal when the env grows; the index is rebuilt if that happens.
+    if index[4] != len(env):
+        index[4] = len(env)
+        if any((name,) in env for name in index[5]):
+            index[:] = [{}, [], set(), 0, len(env), set()]
+    table, dynamic, shapes, start, _, names = index
+    for i in range(start, len(pats)):
+        pat = pats[i][0]
+        leaves = leaf_names(pat)
+        if any((name,) in env for name in leaves):
+            dynamic.append(i)
+            continue
+        value = eval_value(pat, env)
+        try:
+            key, shape = tuple(value), tuple(map(len, value))
+            table.setdefault(key, i)
+        except TypeError:
+            dynamic.append(i)
+            continue
+        shapes.add(shape)
+        names.update(leaves)
+    index[3] = len(pats)
+    return index
+
+def leaf_names(A):
+    if not isinstance(A, list):
+        return [A] if isinstance(A, str) else []
+    names = []
+    for item in A:
+        names.extend(leaf_names(item))
+    return names
+
 def eval_value(A, env):
     if isinstance(A, list):
         result = []
         for item in A:
             sub_val = eval_value(item, env)
             result.extend(sub_val)
-        i = 0
-        while i < len(result):
-            if isinstance(result[i], str):
-                combined = result[i]
-                j = i + 1
-                while j < len(result) and isinstance(result[j], str):
-                    combined += result[j]
-                    j += 1
-                if j > i + 1:  # If we combined anything
-                    result[i:j] = [combined]
-            i += 1
-        return result
+        return coalesce(result)
     else:
         return env.get((A,), [A]) if isinstance(A, str) else [A]
 
+def coalesce(result):
+    # Merge runs of adjacent strings in place, e.g. ["a", "b", x] -> ["ab", x].
+    # Long results become ropes, so growing a value by appending is cheap.
+    i = 0
+    while i < len(result):
+        if isinstance(result[i], (str, Rope)):
+            combined = result[i]
+            j = i + 1
+            while j < len(result) and isinstance(result[j], (str, Rope)):
+                combined = concat(combined, result[j])
+                j += 1
+            if j > i + 1:  # If we combined anything
+                result[i:j] = [combined]
+        i += 1
+    return result
+
+def assigned_keys(prog, env=None):
+    # Every env key the program could ever write. Match results and commands
+    # are plain subtrees of the program, so a walk over the whole tree finds
+    # every statement that can run; names outside this set always evaluate
+    # to themselves.
+    keys = set(env or ())
+    todo = [prog]
+    while todo:
+        node = todo.pop()
+        if isinstance(node, list):
+            if len(node) == 3 and node[1] == ">" and isinstance(node[2], (list, str)):
+                try:
+                    keys.add(tuple(node[2]))
+                except TypeError:
+                    pass
+            todo.extend(node)
+    return keys
+
 # --- DEMO ---
 if __name__ == "__main__":
     init = [
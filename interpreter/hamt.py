@@ -0,0 +1,277 @@
+"""
+Persistent env: a hash array mapped trie behind a dict-like facade.
+
+Map is immutable. set() returns a new map that shares every untouched
+node with the old one: each level of the trie consumes five bits of the
+key's hash, so a write copies at most ~13 small nodes and a lookup reads
+as many. Keys are never removed from an env, so maps do not support it.
+
+Env wraps a Map in the mutable interface the engines use (get, [], in,
+len, items), so it can be passed wherever an env dict is expected:
+
+    env = Env()
+    state = ["program", prog, "env", env, "done", False]
+    run(state, limit=1000)
+    saved = env.snapshot()          # O(1)
+    trial = env.fork()              # O(1), independent from here on
+    env.restore(saved)              # O(1) undo
+    changed = env.snapshot().diff(saved)
+
+Values are shared between forks, which is safe for plain values since
+the engines never change them in place. Actor nodes are the exception:
+defining more patterns extends them. core asks the env for its own copy
+first (Env.own()), which is taken the first time a node is changed after
+a fork or snapshot.
+"""
+from interpreter.core import new_node
+
+# Bits of the hash the trie uses; keys whose hashes agree on all of them
+# share a Collision node.
+MASK = (1 << 64) - 1
+
+MISSING = object()
+
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    # int.bit_count() needs Python 3.10. Bitmaps are 32 bits wide (5 hash
+    # bits per level): look up each half in the set bits of every 16-bit value.
+    HALF_COUNTS = bytes(bin(i).count("1") for i in range(1 << 16))
+
+    def popcount(x):
+        return HALF_COUNTS[x & 0xFFFF] + HALF_COUNTS[x >> 16]
+
+
+class Bitmap:
+    # `array` holds one item per set bit: a (key, value) tuple for a leaf,
+    # or a child node.
+    __slots__ = ("bitmap", "array")
+
+    def __init__(self, bitmap, array):
+        self.bitmap = bitmap
+        self.array = array
+
+
+class Collision:
+    __slots__ = ("hash", "entries")
+
+    def __init__(self, hash, entries):
+        self.hash = hash
+        self.entries = entries
+
+
+EMPTY = Bitmap(0, ())
+
+
+def lookup(node, key, default):
+    h = hash(key) & MASK
+    shift = 0
+    while True:
+        if type(node) is Bitmap:
+            bit = 1 << (h >> shift & 31)
+            if not node.bitmap & bit:
+                return default
+            item = node.array[popcount(node.bitmap & (bit - 1))]
+            if type(item) is tuple:
+                k = item[0]
+                return item[1] if k is key or k == key else default
+            node = item
+            shift += 5
+        else:
+            for k, v in node.entries:
+                if k is key or k == key:
+                    return v
+            return default
+
+
+def assoc(node, shift, h, key, value):
+    # (new node, whether a key was added)
+    if type(node) is Collision:
+        if h == node.hash:
+            entries = node.entries
+            for i, (k, v) in enumerate(entries):
+                if k is key or k == key:
+                    if v is value:
+                        return node, False
+                    return Collision(h, entries[:i] + ((key, value),) + entries[i + 1 :]), False
+            return Collision(h, entries + ((key, value),)), True
+        # Another hash reached this collision: push it one level down.
+        return assoc(Bitmap(1 << (node.hash >> shift & 31), (node,)), shift, h, key, value)
+    bit = 1 << (h >> shift & 31)
+    pos = popcount(node.bitmap & (bit - 1))
+    array = node.array
+    if not node.bitmap & bit:
+        return Bitmap(node.bitmap | bit, array[:pos] + ((key, value),) + array[pos:]), True
+    item = array[pos]
+    if type(item) is tuple:
+        k = item[0]
+        if k is key or k == key:
+            if item[1] is value:
+                return node, False
+            child, added = (key, value), False
+        else:
+            child, added = pair(shift + 5, item, hash(k) & MASK, (key, value), h), True
+    else:
+        child, added = assoc(item, shift + 5, h, key, value)
+        if child is item:
+            return node, False
+    return Bitmap(node.bitmap, array[:pos] + (child,) + array[pos + 1 :]), added
+
+
+def pair(shift, a, ha, b, hb):
+    if ha == hb:
+        return Collision(ha, (a, b))
+    ia, ib = ha >> shift & 31, hb >> shift & 31
+    if ia == ib:
+        return Bitmap(1 << ia, (pair(shift + 5, a, ha, b, hb),))
+    return Bitmap(1 << ia | 1 << ib, (a, b) if ia < ib else (b, a))
+
+
+def entries(item):
+    if item is None:
+        return
+    if type(item) is tuple:
+        yield item
+    elif type(item) is Collision:
+        yield from item.entries
+    else:
+        for child in item.array:
+            yield from entries(child)
+
+
+def diff_nodes(a, b, out):
+    if a is b:
+        return
+    if type(a) is Bitmap and type(b) is Bitmap:
+        bits = a.bitmap | b.bitmap
+        while bits:
+            bit = bits & -bits
+            bits ^= bit
+            x = a.array[popcount(a.bitmap & (bit - 1))] if a.bitmap & bit else None
+            y = b.array[popcount(b.bitmap & (bit - 1))] if b.bitmap & bit else None
+            if x is not y:
+                diff_nodes(x, y, out)
+        return
+    # Leaves, collisions or one side missing: compare what is below.
+    left = dict(entries(a))
+    right = dict(entries(b))
+    for key, value in left.items():
+        if right.get(key, MISSING) is not value:
+            out.append(key)
+    out.extend(key for key in right if key not in left)
+
+
+class Map:
+    __slots__ = ("root", "count")
+
+    def __init__(self, root=EMPTY, count=0):
+        self.root = root
+        self.count = count
+
+    def get(self, key, default=None):
+        return lookup(self.root, key, default)
+
+    def set(self, key, value):
+        root, added = assoc(self.root, 0, hash(key) & MASK, key, value)
+        if root is self.root:
+            return self
+        return Map(root, self.count + added)
+
+    def __contains__(self, key):
+        return lookup(self.root, key, MISSING) is not MISSING
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return (key for key, _ in entries(self.root))
+
+    def items(self):
+        return entries(self.root)
+
+    def diff(self, other):
+        """Keys bound to different objects in the two maps, or in only one.
+        Subtrees the maps share are skipped, so this is cheap for a map and
+        an earlier snapshot of it."""
+        out = []
+        diff_nodes(self.root, other.root, out)
+        return out
+
+
+class Env:
+    __slots__ = ("map", "owned")
+
+    def __init__(self, items=()):
+        self.map = Map()
+        # id -> actor node this env may change in place.
+        self.owned = {}
+        self.update(items)
+
+    @classmethod
+    def of(cls, snapshot):
+        env = cls()
+        env.map = snapshot
+        return env
+
+    def __getitem__(self, key):
+        value = lookup(self.map.root, key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        return lookup(self.map.root, key, default)
+
+    def __setitem__(self, key, value):
+        self.map = self.map.set(key, value)
+
+    def __contains__(self, key):
+        return lookup(self.map.root, key, MISSING) is not MISSING
+
+    def __len__(self):
+        return self.map.count
+
+    def __iter__(self):
+        return iter(self.map)
+
+    def keys(self):
+        return list(self.map)
+
+    def values(self):
+        return [value for _, value in self.map.items()]
+
+    def items(self):
+        return list(self.map.items())
+
+    def update(self, items=()):
+        for key, value in items.items() if hasattr(items, "items") else items:
+            self[key] = value
+
+    def snapshot(self):
+        """The current contents as an immutable Map."""
+        # Nodes in the snapshot must not change, so copy before extending.
+        self.owned = {}
+        return self.map
+
+    def fork(self):
+        return Env.of(self.snapshot())
+
+    copy = fork
+
+    def restore(self, snapshot):
+        self.map = snapshot
+        self.owned = {}
+
+    def own(self, key):
+        """The actor node at key, copied first unless only this env has it."""
+        node = self[key]
+        if self.owned.get(id(node)) is node:
+            return node
+        node = new_node(list(node[1]), list(node[2]) if len(node) > 2 else [])
+        self[key] = node
+        self.owned[id(node)] = node
+        return node
+
+    def __repr__(self):
+        return f"Env({dict(self.map.items())!r})"
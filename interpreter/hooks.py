@@ -0,0 +1,148 @@
+"""
+Callbacks on what a running program does, for tracing, metrics and
+debugging tools that would otherwise patch the engine.
+
+    hooks = Hooks()
+    hooks.on("write", lambda key, value: print(key, value))
+
+    @hooks.on("match")
+    def matched(name, val, pat, result):
+        ...
+
+    run(state, hooks=hooks)         # core.run(), or rewrite(state, hooks)
+
+Events and their arguments:
+
+    statement(stmt, env)            after each statement has run
+    write(key, value)               an env entry was assigned, or an
+                                    actor extended (value is its node)
+    send(name, val)                 val was sent to an actor (not @print)
+    match(name, val, pat, result)   that send matched pattern pat
+    done(env)                       the program has finished
+
+core.run() and rewrite() only switch to the instrumented loop below while
+at least one callback is registered; otherwise they run core.execute()
+exactly as before. The profiler and the trace recorder are built on
+these hooks too, so this is the only instrumented copy of that loop.
+"""
+from interpreter.core import (
+    eval_value,
+    finished,
+    lookup_actor_commands,
+    match_actor,
+    store_actor_command,
+    store_actor_pattern,
+)
+from interpreter import output
+from interpreter.values import text
+
+EVENTS = ("statement", "write", "send", "match", "done")
+
+
+class Hooks:
+    def __init__(self):
+        self.callbacks = {event: [] for event in EVENTS}
+
+    def on(self, event, fn=None):
+        """Register fn for event; without fn, returns a decorator."""
+        if event not in self.callbacks:
+            raise Exception(f"unknown hook event {event}")
+        if fn is None:
+            return lambda fn: self.on(event, fn)
+        self.callbacks[event].append(fn)
+        return fn
+
+    def off(self, event, fn):
+        self.callbacks[event].remove(fn)
+
+    def __bool__(self):
+        return any(self.callbacks.values())
+
+    def execute(self, cont, env, limit=None, cache=None):
+        return execute(cont, env, self, limit, cache)
+
+
+def execute(cont, env, hooks, limit=None, cache=None):
+    # core.execute(), calling the hooks. Returns the number of steps.
+    frames, tail = cont
+    evaluate = eval_value if cache is None else cache.eval
+    callbacks = hooks.callbacks
+    on_statement = callbacks["statement"]
+    on_write = callbacks["write"]
+    on_send = callbacks["send"]
+    on_match = callbacks["match"]
+    steps = 0
+    if limit is None:
+        limit = -1
+    while steps != limit:
+        if frames:
+            frame = frames[-1]
+            block, i = frame
+            if i >= len(block):
+                frames.pop()
+                continue
+            stmt = block[i]
+            frame[1] = i + 1
+        elif tail:
+            stmt = tail.popleft()
+            frame = None
+        else:
+            break
+        steps += 1
+        A, op, B = stmt[0], stmt[1], stmt[2]
+        if op != ">":
+            pass
+        elif isinstance(A, list) and any(
+            isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+        ):
+            for sub in A:
+                if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+                    pat, _, res = sub
+                    store_actor_pattern(env, B, [pat, res])
+                elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+                    store_actor_command(env, B, sub)
+            key = tuple(B)
+            if cache is not None:
+                cache.touch(key)
+            for fn in on_write:
+                fn(key, env[key])
+        elif isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+            val = evaluate(A, env)
+            actor_name = B[1]
+            if actor_name == "print":
+                output.sink.write(text(val) + "\n")
+            else:
+                for fn in on_send:
+                    fn(actor_name, val)
+                match = match_actor(env, [actor_name], val, evaluate)
+                if match is not None:
+                    for fn in on_match:
+                        fn(actor_name, val, match[0], match[1])
+                    result = match[1]
+                    if not (
+                        isinstance(result, list)
+                        and result
+                        and isinstance(result[0], list)
+                    ):
+                        result = [result]
+                    if frame is not None and frame[1] == len(frame[0]):
+                        frame[0], frame[1] = result, 0
+                    else:
+                        frames.append([result, 0])
+                else:
+                    cmds = lookup_actor_commands(env, [actor_name])
+                    if cmds:
+                        tail.extend(cmds)
+        else:
+            key = tuple(B)
+            value = env[key] = evaluate(A, env)
+            if cache is not None:
+                cache.touch(key)
+            for fn in on_write:
+                fn(key, value)
+        for fn in on_statement:
+            fn(stmt, env)
+    if finished(cont):
+        for fn in callbacks["done"]:
+            fn(env)
+    return steps
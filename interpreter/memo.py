@@ -0,0 +1,60 @@
+"""
+Dependency-tracked memoization of eval_value().
+
+Results are cached per expression node together with the version of every
+env key the expression reads. Writers call touch(key) after changing a key,
+which bumps its version, so only expressions that read that key are
+recomputed on their next evaluation.
+
+    cache = EvalCache()
+    run(state, cache=cache)
+    print(cache.stats())
+"""
+from interpreter.core import eval_value, leaf_names
+
+
+class EvalCache:
+    def __init__(self):
+        # id(node) -> [node, value, keys, versions]; the node is kept alive
+        # so its id cannot be reused by another list.
+        self.entries = {}
+        self.versions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def eval(self, A, env):
+        """Drop-in replacement for eval_value(A, env)."""
+        if not isinstance(A, list):
+            return eval_value(A, env)
+        versions = self.versions
+        entry = self.entries.get(id(A))
+        if entry is not None:
+            for key, version in zip(entry[2], entry[3]):
+                if versions.get(key, 0) != version:
+                    break
+            else:
+                self.hits += 1
+                return entry[1]
+            keys = entry[2]
+        else:
+            keys = tuple({(name,): None for name in leaf_names(A)})
+        self.misses += 1
+        value = eval_value(A, env)
+        self.entries[id(A)] = [A, value, keys, [versions.get(key, 0) for key in keys]]
+        return value
+
+    def touch(self, key):
+        """Record that env[key] has been written."""
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+        }
@@ -0,0 +1,189 @@
+"""
+Memory accounting for long runs of the stack engine.
+
+run() executes a program like core.run(), stopping every `every`
+statements to sample:
+
+- the deep size of every env entry (an object shared by several entries
+  is counted in each of them);
+- for actors, the size of their pattern and command tables and of their
+  dispatch index;
+- the pending program: statements left to run and frames on the stack;
+- the memory Python has allocated, through tracemalloc.
+
+The report lists the largest entries with their peak, final size and
+growth per thousand statements, and the source lines whose allocations
+grew the most between the first and last sample.
+
+    arrow --mem-report --mem-every 50000 prog.ar
+"""
+import sys
+import tracemalloc
+from collections import deque
+
+from interpreter import output
+from interpreter.core import Actor, execute, load, pending
+from interpreter.values import Rope
+
+# Statements between samples.
+EVERY = 10_000
+
+
+def deep_size(x, seen=None):
+    """Bytes held by x and everything it refers to, each object once."""
+    if seen is None:
+        seen = set()
+    size = 0
+    stack = [x]
+    while stack:
+        x = stack.pop()
+        if id(x) in seen:
+            continue
+        seen.add(id(x))
+        size += sys.getsizeof(x)
+        t = type(x)
+        if t is list or t is tuple or t is set or t is deque:
+            stack.extend(x)
+        elif t is dict:
+            stack.extend(x.keys())
+            stack.extend(x.values())
+        elif t is Rope:
+            stack.append(x.runs)
+            stack.append(x.last)
+            if x.flat is not None:
+                stack.append(x.flat)
+    return size
+
+
+def is_node(value):
+    return isinstance(value, list) and len(value) >= 2 and value[0] == "matchcases"
+
+
+def fmt_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+class MemoryReport:
+    def __init__(self, every=EVERY):
+        self.every = every
+        self.samples = 0
+        self.steps = 0
+        # key -> [first size, first step, peak, last size, last step]
+        self.entries = {}
+        # key -> [patterns, commands, pattern bytes, command bytes, index bytes]
+        self.actors = {}
+        self.pending_peak = self.pending_peak_step = self.frames_peak = 0
+        self.pending_last = 0
+        self.traced_peak = self.traced_last = 0
+        self.first_snapshot = None
+        self.growth = []
+
+    def sample(self, cont, env, steps):
+        self.samples += 1
+        self.steps = steps
+        for key, value in list(env.items()):
+            if is_node(value):
+                commands = value[2] if len(value) > 2 else []
+                index = value.index if type(value) is Actor else None
+                tables = [deep_size(value[1]), deep_size(commands), deep_size(index) if index else 0]
+                self.actors[key] = [len(value[1]), len(commands)] + tables
+                size = sum(tables)
+            else:
+                size = deep_size(value)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = [size, steps, size, size, steps]
+            else:
+                entry[2] = max(entry[2], size)
+                entry[3], entry[4] = size, steps
+        frames, tail = cont
+        left = sum(len(block) - i for block, i in frames) + len(tail)
+        self.pending_last = left
+        if left > self.pending_peak:
+            self.pending_peak, self.pending_peak_step = left, steps
+        self.frames_peak = max(self.frames_peak, len(frames))
+        if tracemalloc.is_tracing():
+            self.traced_last, peak = tracemalloc.get_traced_memory()
+            self.traced_peak = max(self.traced_peak, peak)
+
+    def snapshot(self):
+        # Leaves out the sampling itself.
+        return tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        )
+
+    def start(self):
+        if tracemalloc.is_tracing():
+            self.first_snapshot = self.snapshot()
+
+    def finish(self, top=10):
+        if self.first_snapshot is not None and tracemalloc.is_tracing():
+            stats = self.snapshot().compare_to(self.first_snapshot, "lineno")
+            self.growth = [stat for stat in stats if stat.size_diff > 0][:top]
+
+    def report(self, top=20):
+        lines = [f"memory: {self.samples} samples every {self.every} statements, {self.steps} statements"]
+        if self.traced_peak:
+            lines.append(f"traced memory: peak {fmt_bytes(self.traced_peak)}, final {fmt_bytes(self.traced_last)}")
+        lines.append(
+            f"pending program: peak {self.pending_peak} statements (at statement {self.pending_peak_step}), "
+            f"final {self.pending_last}; deepest stack {self.frames_peak} frames"
+        )
+        lines.append("")
+        lines.append(f"{'env entry':30} {'peak':>10} {'final':>10} {'growth/1k':>10}")
+        ranked = sorted(self.entries.items(), key=lambda item: -item[1][2])
+        for key, (first, first_step, peak, last, last_step) in ranked[:top]:
+            span = last_step - first_step
+            growth = (last - first) * 1000 / span if span else 0
+            name = " ".join(key)
+            if key in self.actors:
+                name += " (actor)"
+            lines.append(f"{name[:30]:30} {fmt_bytes(peak):>10} {fmt_bytes(last):>10} {fmt_bytes(growth):>10}")
+        if self.actors:
+            lines.append("")
+            lines.append(f"{'actor':30} {'patterns':>9} {'commands':>9} {'pat bytes':>10} {'cmd bytes':>10} {'index':>10}")
+            ranked = sorted(self.actors.items(), key=lambda item: -sum(item[1][2:]))
+            for key, (patterns, commands, pat_bytes, cmd_bytes, index_bytes) in ranked[:top]:
+                lines.append(
+                    f"{' '.join(key)[:30]:30} {patterns:>9} {commands:>9} {fmt_bytes(pat_bytes):>10} "
+                    f"{fmt_bytes(cmd_bytes):>10} {fmt_bytes(index_bytes):>10}"
+                )
+        if self.growth:
+            lines.append("")
+            lines.append("allocation growth by line (tracemalloc):")
+            for stat in self.growth:
+                frame = stat.traceback[0]
+                lines.append(f"  {frame.filename}:{frame.lineno}: +{fmt_bytes(stat.size_diff)} ({stat.count_diff:+} blocks)")
+        return "\n".join(lines)
+
+
+def run(state, report, cache=None, trace_allocations=True):
+    # Same interface as core.run(), sampling into report.
+    if state[5]:
+        return state
+    started = trace_allocations and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    try:
+        cont = load(state[1])
+        env = state[3]
+        report.start()
+        report.sample(cont, env, 0)
+        steps = 0
+        while True:
+            n = execute(cont, env, report.every, cache)
+            steps += n
+            report.sample(cont, env, steps)
+            if n < report.every:
+                break
+        report.finish()
+    finally:
+        output.flush()
+        if started:
+            tracemalloc.stop()
+    state[1] = pending(cont)
+    state[5] = not state[1]
+    return state
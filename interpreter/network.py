@@ -0,0 +1,367 @@
+"""
+TCP transport: actors hosted by other Arrow processes.
+
+Every process is a node: an aio.Runtime that also listens on a TCP port.
+Once its top-level program has run, a node registers the actors it
+defines with a registry server. A send to a name that is not a local
+actor is resolved through the registry (and cached), and queued for the
+peer that hosts it. Without a registry a node only has its local actors,
+and sending to a name it has never bound is an error. Everything queued
+for one peer is written as a single frame, so a burst of sends costs one
+write. Received messages are delivered to local actors, and are never
+forwarded again.
+
+Frames are a 4-byte big-endian length followed by the payload. A batch
+payload is a varint message count, then each message's actor name and
+value. Strings are a varint byte length followed by UTF-8 data, and a
+value is a varint item count followed by items tagged 0 (string) or
+1 (nested value). Registry requests and replies are single values.
+
+    python -m interpreter.network [port]         # start a registry
+    arrow --engine network --registry 127.0.0.1:7000 a.ar
+    arrow --engine network a.ar                  # local actors only
+
+A node exits once it has had nothing to do for `linger` seconds.
+"""
+import asyncio
+import struct
+import sys
+import time
+
+from interpreter import output
+from interpreter.aio import Runtime
+from interpreter.values import is_text
+
+REGISTRY_PORT = 7000
+
+HEADER = struct.Struct(">I")
+
+
+def put_varint(out, n):
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def get_varint(buf, pos):
+    n = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+
+def put_text(out, s):
+    data = str(s).encode("utf-8")
+    put_varint(out, len(data))
+    out += data
+
+
+def get_text(buf, pos):
+    n, pos = get_varint(buf, pos)
+    return bytes(buf[pos : pos + n]).decode("utf-8"), pos + n
+
+
+def put_value(out, val):
+    put_varint(out, len(val))
+    for item in val:
+        if isinstance(item, list):
+            out.append(1)
+            put_value(out, item)
+        elif is_text(item):
+            out.append(0)
+            put_text(out, item)
+        else:
+            raise Exception(f"cannot send a {type(item).__name__} to another node")
+
+
+def get_value(buf, pos):
+    n, pos = get_varint(buf, pos)
+    val = []
+    for _ in range(n):
+        tag = buf[pos]
+        if tag == 0:
+            item, pos = get_text(buf, pos + 1)
+        elif tag == 1:
+            item, pos = get_value(buf, pos + 1)
+        else:
+            raise Exception(f"bad value tag {tag}")
+        val.append(item)
+    return val, pos
+
+
+def pack_batch(msgs):
+    out = bytearray(HEADER.size)
+    put_varint(out, len(msgs))
+    for name, val in msgs:
+        put_text(out, name)
+        put_value(out, val)
+    HEADER.pack_into(out, 0, len(out) - HEADER.size)
+    return out
+
+
+def unpack_batch(payload):
+    count, pos = get_varint(payload, 0)
+    msgs = []
+    for _ in range(count):
+        name, pos = get_text(payload, pos)
+        val, pos = get_value(payload, pos)
+        msgs.append((name, val))
+    return msgs
+
+
+def pack_value(val):
+    out = bytearray(HEADER.size)
+    put_value(out, val)
+    HEADER.pack_into(out, 0, len(out) - HEADER.size)
+    return out
+
+
+async def read_frame(reader):
+    try:
+        header = await reader.readexactly(HEADER.size)
+        return await reader.readexactly(HEADER.unpack(header)[0])
+    except asyncio.IncompleteReadError:
+        return None
+
+
+async def serve_registry(host="127.0.0.1", port=REGISTRY_PORT):
+    """Run a registry until cancelled. Requests are ["register", host, port,
+    name...] and ["lookup", name]; a lookup answers [host, port] or []."""
+    names = {}
+
+    async def handle(reader, writer):
+        while True:
+            payload = await read_frame(reader)
+            if payload is None:
+                break
+            request, _ = get_value(payload, 0)
+            if request[0] == "register":
+                for name in request[3:]:
+                    names[name] = request[1:3]
+                reply = []
+            elif request[0] == "lookup":
+                reply = names.get(request[1], [])
+            else:
+                reply = ["error", f"unknown request {request[0]}"]
+            writer.write(pack_value(reply))
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+class Node(Runtime):
+    def __init__(self, env, registry=None, yield_every=100, write=None, resolve_timeout=5.0):
+        super().__init__(env, yield_every, write)
+        self.registry = registry
+        self.registry_conn = None
+        self.registry_lock = asyncio.Lock()
+        self.resolve_timeout = resolve_timeout
+        self.address = None
+        # name -> (host, port); name -> values waiting for resolution;
+        # (host, port) -> messages waiting to be written, and its writer.
+        self.routes = {}
+        self.unresolved = {}
+        self.outboxes = {}
+        self.flushing = set()
+        self.peers = {}
+        self.background = set()
+        # Writer -> task of every connection accepted from a peer.
+        self.connections = {}
+        self.activity = time.monotonic()
+
+    def send(self, name, val):
+        node = self.env.get((name,))
+        if node and node[0] == "matchcases":
+            super().send(name, val)
+            return
+        if self.registry is None:
+            if (name,) in self.env:
+                # Bound, but not to an actor: dropped, as under step().
+                return
+            raise Exception(f"cannot send to '{name}': it is not a local actor and no registry was given")
+        # Counted until written, so the node does not exit with mail queued.
+        self.outstanding += 1
+        self.idle.clear()
+        address = self.routes.get(name)
+        if address is not None:
+            self.enqueue(address, name, val)
+        elif name in self.unresolved:
+            self.unresolved[name].append(val)
+        else:
+            self.unresolved[name] = [val]
+            self.spawn(self.resolve(name))
+
+    def spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self.background.add(task)
+        task.add_done_callback(self.finished)
+
+    def finished(self, task):
+        self.background.discard(task)
+        if not task.cancelled() and task.exception() is not None and self.error is None:
+            self.error = task.exception()
+            self.idle.set()
+
+    def done(self, n):
+        super().done(n)
+        if not self.outstanding:
+            self.activity = time.monotonic()
+
+    async def connect(self):
+        try:
+            self.registry_conn = await asyncio.open_connection(*self.registry)
+        except OSError:
+            host, port = self.registry
+            raise Exception(
+                f"no registry at {host}:{port} (start one with python -m interpreter.network {port})"
+            )
+
+    async def request(self, value):
+        async with self.registry_lock:
+            if self.registry_conn is None:
+                await self.connect()
+            reader, writer = self.registry_conn
+            writer.write(pack_value(value))
+            await writer.drain()
+            payload = await read_frame(reader)
+            if payload is None:
+                raise Exception("registry closed the connection")
+            return get_value(payload, 0)[0]
+
+    async def register(self):
+        names = [
+            key[0]
+            for key, node in list(self.env.items())
+            if len(key) == 1 and isinstance(node, list) and node and node[0] == "matchcases"
+        ]
+        if names and self.registry is not None:
+            await self.request(["register", self.address[0], str(self.address[1])] + names)
+
+    async def resolve(self, name):
+        # Peers register after running their own program, so keep asking
+        # for a while before giving up on the name.
+        deadline = time.monotonic() + self.resolve_timeout
+        while True:
+            reply = await self.request(["lookup", name])
+            if reply or time.monotonic() > deadline:
+                break
+            await asyncio.sleep(0.05)
+        vals = self.unresolved.pop(name)
+        if not reply:
+            # Nobody hosts it: dropped, like a send to a non-actor.
+            self.done(len(vals))
+            return
+        address = self.routes[name] = (reply[0], int(reply[1]))
+        for val in vals:
+            self.enqueue(address, name, val)
+
+    def enqueue(self, address, name, val):
+        self.outboxes.setdefault(address, []).append((name, val))
+        if address not in self.flushing:
+            self.flushing.add(address)
+            self.spawn(self.flush(address))
+
+    async def flush(self, address):
+        # One flusher per peer, so frames go out in send order. It first
+        # runs when the runtime yields, by which time the current burst of
+        # sends has been queued, and writes each burst as one frame.
+        try:
+            writer = self.peers.get(address)
+            if writer is None:
+                _, writer = await asyncio.open_connection(*address)
+                self.peers[address] = writer
+            while self.outboxes.get(address):
+                msgs = self.outboxes.pop(address)
+                writer.write(pack_batch(msgs))
+                await writer.drain()
+                self.done(len(msgs))
+        finally:
+            self.flushing.discard(address)
+
+    async def accept(self, reader, writer):
+        self.connections[writer] = asyncio.current_task()
+        try:
+            while True:
+                payload = await read_frame(reader)
+                if payload is None:
+                    break
+                self.activity = time.monotonic()
+                for name, val in unpack_batch(payload):
+                    node = self.env.get((name,))
+                    if node and node[0] == "matchcases":
+                        Runtime.send(self, name, val)
+        finally:
+            del self.connections[writer]
+            writer.close()
+
+    async def close(self):
+        for task in list(self.background):
+            task.cancel()
+        await asyncio.gather(*self.background, return_exceptions=True)
+        # Closing an accepted connection ends its task at the next read;
+        # cancelling the task instead would be reported by asyncio.
+        accepted = list(self.connections.items())
+        for writer, _ in accepted:
+            writer.close()
+        await asyncio.gather(*[task for _, task in accepted], return_exceptions=True)
+        writers = list(self.peers.values())
+        if self.registry_conn is not None:
+            writers.append(self.registry_conn[1])
+        for writer in writers:
+            writer.close()
+        await self.shutdown()
+
+
+async def run_node(state, registry=None, host="127.0.0.1", port=0,
+                   linger=1.0, yield_every=100, write=None):
+    # Runs the program as a node and returns once it has been idle for
+    # `linger` seconds (never, with linger=None).
+    if state[5]:
+        return state
+    node = Node(state[3], registry, yield_every, write)
+    server = await asyncio.start_server(node.accept, host, port)
+    node.address = server.sockets[0].getsockname()[:2]
+    try:
+        if registry is not None:
+            await node.connect()
+        await node.execute(state[1])
+        await node.register()
+        node.activity = time.monotonic()
+        while node.error is None:
+            while node.outstanding and node.error is None:
+                await node.idle.wait()
+            if node.error is not None:
+                break
+            quiet = time.monotonic() - node.activity
+            if linger is not None and quiet >= linger:
+                break
+            await asyncio.sleep(linger - quiet if linger is not None else 1.0)
+    finally:
+        server.close()
+        await node.close()
+        output.flush()
+    if node.error is not None:
+        raise node.error
+    state[1], state[5] = [], True
+    return state
+
+
+def run(state, registry=None, host="127.0.0.1", port=0, linger=1.0):
+    return asyncio.run(run_node(state, registry, host, port, linger))
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else REGISTRY_PORT
+    print(f"arrow registry on 127.0.0.1:{port}")
+    try:
+        asyncio.run(serve_registry("127.0.0.1", port))
+    except KeyboardInterrupt:
+        pass
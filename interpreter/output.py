@@ -0,0 +1,141 @@
+"""
+Where @print output goes.
+
+Every engine prints by calling write(text) on the current sink (or on the
+`write` it was given). Sinks buffer what they are given and pass it on in
+large pieces instead of one write per line; engines flush the sink when a
+run finishes or fails, and the current sink is flushed at exit.
+
+    from interpreter import output
+    with output.use(output.ListSink()) as sink:
+        run(state)
+    print(sink.lines)
+
+Sinks: StdoutSink (the default), FileSink, ListSink and NullSink.
+
+    arrow --output null prog.ar
+    arrow --output out.txt prog.ar
+"""
+import abc
+import atexit
+import contextlib
+import sys
+
+# Characters buffered before a sink writes them out.
+BUFFER = 1 << 16
+
+
+class Sink(abc.ABC):
+    def __init__(self, buffer=BUFFER):
+        self.buffer = buffer
+        self.parts = []
+        self.size = 0
+
+    def write(self, s):
+        self.parts.append(s)
+        self.size += len(s)
+        if self.size >= self.buffer:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            data = "".join(self.parts)
+            self.parts = []
+            self.size = 0
+            self.emit(data)
+
+    @abc.abstractmethod
+    def emit(self, data):
+        """Pass on buffered output."""
+
+    def close(self):
+        self.flush()
+
+
+class StdoutSink(Sink):
+    # Whatever sys.stdout is when the buffer is flushed.
+    def emit(self, data):
+        sys.stdout.write(data)
+        sys.stdout.flush()
+
+
+class FileSink(Sink):
+    def __init__(self, path, buffer=BUFFER):
+        super().__init__(buffer)
+        self.file = open(path, "w", encoding="utf-8")
+
+    def emit(self, data):
+        self.file.write(data)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class ListSink(Sink):
+    # Keeps the output in `lines`, split at newlines. Text after the last
+    # newline is kept back until more is written or the sink is closed.
+    def __init__(self):
+        super().__init__(0)
+        self.lines = []
+        self.rest = ""
+
+    def emit(self, data):
+        *done, self.rest = (self.rest + data).split("\n")
+        self.lines.extend(done)
+
+    write = emit
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.rest:
+            self.lines.append(self.rest)
+            self.rest = ""
+
+
+class NullSink(Sink):
+    def emit(self, data):
+        pass
+
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+
+sink = StdoutSink()
+
+
+def write(s):
+    sink.write(s)
+
+
+def flush():
+    sink.flush()
+
+
+def open_sink(name):
+    """The sink `arrow --output` names: stdout, null, or a file path."""
+    if name == "stdout":
+        return StdoutSink()
+    if name == "null":
+        return NullSink()
+    return FileSink(name)
+
+
+@contextlib.contextmanager
+def use(new):
+    """Make new the current sink for the duration; it is closed afterwards."""
+    global sink
+    old, sink = sink, new
+    try:
+        yield new
+    finally:
+        sink = old
+        new.close()
+
+
+atexit.register(flush)
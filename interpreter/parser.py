@@ -1,67 +1,102 @@
+import re
+from array import array
+
 from interpreter.core import rewrite
 
+# Token kinds.
+STRING, OPEN, CLOSE, COMMA, ARROW, SEND, WORD = range(7)
+
+# One group per kind, numbered like the kinds, after any whitespace and
+# comments. A quote that never closes matches only the last group, and
+# whitespace at the end of the code matches no group.
+TOKEN = re.compile(
+    r"""(?:\s|#[^\n]*)*(?:"""
+    r"""("[^"]*")"""  # STRING
+    r"""|(\[)|(\])|(,)|(=>)|(>)"""
+    r"""|([^\s\[\],"]+)"""  # WORD
+    r"""|(")|\Z"""
+    r""")"""
+)
+UNTERMINATED = WORD + 2
+
+# What each kind parses to, for those that are always the same.
+FIXED = {OPEN: "[", CLOSE: "]", COMMA: ",", ARROW: "=>", SEND: ">"}
+
+
+class Tokens:
+    """
+    The tokens of code as three parallel arrays: kinds, and start and end
+    offsets into code. The text of a token is only sliced out of code
+    when it is asked for.
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self.kinds = array("B")
+        self.starts = array("L")
+        self.ends = array("L")
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def text(self, i):
+        kind = self.kinds[i]
+        if kind in FIXED:
+            return FIXED[kind]
+        return self.code[self.starts[i] : self.ends[i]]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.text(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        return self.text(i)
+
+    def __iter__(self):
+        return (self.text(i) for i in range(len(self)))
+
+
 def tokenize(code):
-    tokens = []
-    i = 0
-    while i < len(code):
-        c = code[i]
-        if c.isspace():
-            i += 1
-        elif c == '#':  # Skip comments
-            while i < len(code) and code[i] != '\n':
-                i += 1
-        elif c == '"':  # quoted string
-            i += 1
-            start = i
-            while i < len(code) and code[i] != '"':
-                i += 1
-            if i >= len(code):
-                raise Exception("Unterminated string literal")
-            tokens.append('"' + code[start:i] + '"')
-            i += 1
-        elif c in "[],":
-            tokens.append(c)
-            i += 1
-        elif c == "=" and i + 1 < len(code) and code[i + 1] == ">":
-            tokens.append("=>")
-            i += 2
-        elif c == ">":
-            tokens.append(">")
-            i += 1
-        else:
-            start = i
-            while i < len(code) and (not code[i].isspace()) and code[i] not in '[],"':
-                i += 1
-            tokens.append(code[start:i])
+    tokens = Tokens(code)
+    add_kind, add_start, add_end = tokens.kinds.append, tokens.starts.append, tokens.ends.append
+    for m in TOKEN.finditer(code):
+        group = m.lastindex
+        if group is None:
+            continue
+        if group == UNTERMINATED:
+            raise Exception("Unterminated string literal")
+        add_kind(group - 1)
+        add_start(m.start(group))
+        add_end(m.end())  # the token is always the end of the match
     return tokens
 
 def parse(code):
     """Parse the code string into a nested list structure (raw AST)."""
-    tokens = tokenize("[" + code + "]")  # wrap code so top-level is a list
-
-    def build_ast(tokens):
-        if not tokens:
-            raise Exception("Unexpected end of input")
-        token = tokens.pop(0)
-        if token == "[":
-            lst = []
-            while tokens and tokens[0] != "]":
-                if tokens[0] == ",":
-                    tokens.pop(0)
-                    continue
-                lst.append(build_ast(tokens))
-            if not tokens:
-                raise Exception("Expected ']' but reached end of tokens")
-            tokens.pop(0)  # remove closing bracket
-            return lst
-        elif token == "]":
-            raise Exception("Unexpected token: ']'")
-        elif token == ",":
-            return build_ast(tokens)
-        else:
-            return token
-
-    return build_ast(tokens)
+    code = "[" + code + "]"  # wrap code so top-level is a list
+    tokens = tokenize(code)
+    kinds, starts, ends = tokens.kinds, tokens.starts, tokens.ends
+    # The first token is the opening bracket added above. Whatever follows
+    # the bracket that closes it is ignored.
+    ast = lst = []
+    stack = []
+    for i in range(1, len(kinds)):
+        kind = kinds[i]
+        if kind == STRING or kind == WORD:
+            lst.append(code[starts[i] : ends[i]])
+        elif kind == OPEN:
+            inner = []
+            lst.append(inner)
+            stack.append(lst)
+            lst = inner
+        elif kind == CLOSE:
+            if not stack:
+                return ast
+            lst = stack.pop()
+        elif kind == SEND:
+            lst.append(">")
+        elif kind == ARROW:
+            lst.append("=>")
+    raise Exception("Expected ']' but reached end of tokens")
 
 def desugar(ast):
     """
@@ -0,0 +1,176 @@
+"""
+Profiler for the stack engine: where a program spends its statements.
+
+run() executes a program like core.run() and fills a Profile with
+
+- per statement: how often it ran and the wall time spent running it
+  (evaluating its value and handling the send, not the statements a
+  match pushes, which are counted on their own), measured from the end
+  of the statement before it;
+- per actor: messages received, patterns compared (each send-time
+  evaluation of a pattern, plus one lookup in the dispatch index when the
+  actor has literal patterns), messages matched, and statements enqueued
+  (the matched block, or the commands queued when nothing matched).
+
+The profiler is a set of callbacks on the hooks loop (interpreter/hooks.py),
+so an ordinary run pays nothing for it.
+
+    arrow --profile prog.ar
+    arrow --profile --profile-json prog.json prog.ar
+"""
+import time
+
+from interpreter.core import Actor, eval_value, load, lookup_actor_commands, pending
+from interpreter import output
+from interpreter.hooks import Hooks
+
+
+def show(x, limit=60):
+    # Statement or value in roughly the syntax it was written in.
+    def render(x):
+        if isinstance(x, list):
+            if len(x) == 1 and isinstance(x[0], str):
+                return render(x[0])
+            return "[" + " ".join(render(item) for item in x) + "]"
+        x = str(x)
+        return x if x and " " not in x else f'"{x}"'
+
+    if isinstance(x, list) and len(x) == 3 and x[1] in (">", "=>"):
+        A, op, B = x
+        A = render(A[0] if isinstance(A, list) and len(A) == 1 else A)
+        B = "@" + B[1] if isinstance(B, list) and B[:1] == ["@"] else " ".join(map(render, B))
+        s = f"{A} {op} {B}"
+    else:
+        s = render(x)
+    return s if len(s) <= limit else s[: limit - 3] + "..."
+
+
+class Profile:
+    def __init__(self):
+        # id(stmt) -> [stmt, count, seconds]; the statement is kept alive so
+        # its id is not reused.
+        self.statements = {}
+        # actor name -> [received, compared, matched, enqueued]
+        self.actors = {}
+        self.steps = 0
+        self.seconds = 0.0
+
+    def report(self, top=20):
+        lines = [f"{self.steps} statements in {self.seconds:.3f}s"]
+        if self.actors:
+            lines.append("")
+            lines.append(f"{'actor':24} {'received':>10} {'compared':>10} {'matched':>10} {'enqueued':>10}")
+            ranked = sorted(self.actors.items(), key=lambda item: -item[1][0])
+            for name, counts in ranked[:top]:
+                lines.append(f"{name[:24]:24} " + " ".join(f"{n:>10}" for n in counts))
+        lines.append("")
+        lines.append(f"{'statement':60} {'count':>10} {'seconds':>9} {'per call':>9}")
+        ranked = sorted(self.statements.values(), key=lambda entry: -entry[2])
+        for stmt, count, seconds in ranked[:top]:
+            lines.append(f"{show(stmt):60} {count:>10} {seconds:>9.3f} {seconds / count * 1e6:>7.1f}us")
+        return "\n".join(lines)
+
+    def to_json(self):
+        fields = ("received", "compared", "matched", "enqueued")
+        return {
+            "steps": self.steps,
+            "seconds": self.seconds,
+            "actors": {name: dict(zip(fields, counts)) for name, counts in self.actors.items()},
+            "statements": [
+                {"statement": show(stmt, limit=200), "count": count, "seconds": seconds}
+                for stmt, count, seconds in sorted(self.statements.values(), key=lambda entry: -entry[2])
+            ],
+        }
+
+
+class Counting:
+    # Cache interface that counts value evaluations for the profiler.
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.evaluate = eval_value if cache is None else cache.eval
+        self.calls = 0
+
+    def eval(self, A, env):
+        self.calls += 1
+        return self.evaluate(A, env)
+
+    def touch(self, key):
+        if self.cache is not None:
+            self.cache.touch(key)
+
+
+def execute_profiled(cont, env, profile, limit=None, cache=None):
+    # core.execute() through the hooks loop, recording into profile.
+    # Returns the number of steps.
+    statements = profile.statements
+    actors = profile.actors
+    clock = time.perf_counter
+    counting = Counting(cache)
+    # [actor counts, evaluations before matching, matched] of the send
+    # being run, if the current statement is one.
+    sending = None
+    hooks = Hooks()
+
+    @hooks.on("send")
+    def send(name, val):
+        nonlocal sending
+        counts = actors.get(name)
+        if counts is None:
+            counts = actors[name] = [0, 0, 0, 0]
+        counts[0] += 1
+        sending = [counts, counting.calls, False]
+
+    @hooks.on("match")
+    def match(name, val, pat, result):
+        counts = sending[0]
+        counts[2] += 1
+        if isinstance(result, list) and result and isinstance(result[0], list):
+            counts[3] += len(result)
+        else:
+            counts[3] += 1
+        sending[2] = True
+
+    @hooks.on("statement")
+    def statement(stmt, env):
+        nonlocal sending, last
+        t = clock() - last
+        if sending is not None:
+            counts, calls, matched = sending
+            name = stmt[2][1]
+            compared = counting.calls - calls
+            node = env.get((name,))
+            if type(node) is Actor and node.index[0]:
+                compared += 1
+            counts[1] += compared
+            if not matched:
+                cmds = lookup_actor_commands(env, [name])
+                if cmds:
+                    counts[3] += len(cmds)
+            sending = None
+        entry = statements.get(id(stmt))
+        if entry is None:
+            statements[id(stmt)] = [stmt, 1, t]
+        else:
+            entry[1] += 1
+            entry[2] += t
+        last = clock()
+
+    started = last = clock()
+    steps = hooks.execute(cont, env, limit, counting)
+    profile.steps += steps
+    profile.seconds += clock() - started
+    return steps
+
+
+def run(state, profile, limit=None, cache=None):
+    # Same interface as core.run(), recording into profile.
+    if state[5]:
+        return state
+    cont = load(state[1])
+    try:
+        execute_profiled(cont, state[3], profile, limit, cache)
+    finally:
+        output.flush()
+    state[1] = pending(cont)
+    state[5] = not state[1]
+    return state
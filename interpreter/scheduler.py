@@ -0,0 +1,97 @@
+"""
+Preemptive scheduler for running many Arrow programs in one process.
+
+Each job is an ordinary state (["program", prog, "env", env, "done", done])
+plus its core.execute() continuation. Jobs take turns running a quantum of
+statements; the next turn always goes to the job with the least weighted
+run time (steps / weight), so a runaway program only ever delays the
+others by one quantum.
+
+    sched = Scheduler(quantum=1000)
+    sched.add(state_a, "a")
+    sched.add(state_b, "b", weight=2)
+    for job in sched.run():
+        print(job.name, job.steps, job.error)
+"""
+import heapq
+
+from interpreter import output
+from interpreter.core import execute, finished, load, pending
+
+
+class Job:
+    def __init__(self, name, state, weight=1, max_steps=None, cache=None):
+        if weight <= 0:
+            raise Exception("Job weight must be positive")
+        self.name = name
+        self.state = state
+        self.cont = load(state[1])
+        self.weight = weight
+        self.max_steps = max_steps
+        self.cache = cache
+        self.steps = 0
+        self.error = None
+        self.finished = state[5]
+
+    def finish(self, error=None):
+        # A job stopped by an error or its step limit keeps the rest of its
+        # program in the state, with done still False.
+        self.error = error
+        self.finished = True
+        self.state[1] = pending(self.cont)
+        self.state[5] = not self.state[1]
+
+
+class Scheduler:
+    def __init__(self, quantum=1000):
+        if quantum < 1:
+            raise Exception("Scheduler quantum must be at least 1")
+        self.quantum = quantum
+        self.jobs = []
+        # Heap of (virtual run time, sequence, job).
+        self.queue = []
+        self.seq = 0
+
+    def add(self, state, name=None, weight=1, max_steps=None, cache=None):
+        job = Job(name or f"job{len(self.jobs)}", state, weight, max_steps, cache)
+        self.jobs.append(job)
+        if job.finished:
+            return job
+        # Start at the current minimum so a late job neither waits behind
+        # everyone's accumulated time nor monopolizes the loop.
+        vtime = self.queue[0][0] if self.queue else 0
+        heapq.heappush(self.queue, (vtime, self.seq, job))
+        self.seq += 1
+        return job
+
+    def tick(self):
+        """Give one quantum to the most deserving job; False when idle."""
+        if not self.queue:
+            return False
+        vtime, _, job = heapq.heappop(self.queue)
+        budget = max(1, int(self.quantum * job.weight))
+        if job.max_steps is not None:
+            budget = min(budget, job.max_steps - job.steps)
+        try:
+            n = execute(job.cont, job.state[3], budget, job.cache)
+        except Exception as e:
+            job.finish(e)
+            return True
+        job.steps += n
+        if n < budget or finished(job.cont):
+            job.finish()
+        elif job.max_steps is not None and job.steps >= job.max_steps:
+            job.finish(Exception(f"step limit of {job.max_steps} reached"))
+        else:
+            heapq.heappush(self.queue, (vtime + n / job.weight, self.seq, job))
+            self.seq += 1
+        return True
+
+    def run(self):
+        """Run every job to completion and return them in the order added."""
+        try:
+            while self.tick():
+                pass
+        finally:
+            output.flush()
+        return self.jobs
@@ -0,0 +1,308 @@
+"""
+Multi-process engine: actors are partitioned across worker processes.
+
+The top-level program runs in the parent, which then starts one worker
+per shard with a copy of the env. The actor `name` lives on shard
+crc32(name) % workers. A send to an actor on the same shard goes straight
+onto the worker's local queue. Sends to other shards are collected and
+reported to the parent in batches, and the parent forwards them over the
+destination worker's pipe. Workers send their @print output with every
+report, so only the parent writes.
+
+Each worker owns a separate copy of the env. Writes made by an actor are
+seen by the actors on the same shard only, and they are merged back into
+the state's env at the end. Actors must be defined by the top-level
+program to be reachable from every shard. Programs whose actors only talk
+through messages behave as under the other engines, and spread over as
+many cores as there are shards.
+
+With deterministic=True the workers run in lockstep rounds. In each
+round every shard handles the messages sent to it in the previous round,
+and the parent merges the results in shard order. Output and message
+order then do not depend on timing, which is what tests want.
+
+Large strings and ropes cross the pipes as shared-memory handles (see
+interpreter/shm.py). Only the handles are pickled, and released handles
+travel back to the process that owns the segment.
+"""
+import multiprocessing
+import os
+import queue as queues
+import threading
+import zlib
+from collections import deque
+from multiprocessing.connection import wait
+
+from interpreter import output
+from interpreter.core import (
+    eval_value,
+    lookup_actor_commands,
+    match_actor,
+    store_actor_command,
+    store_actor_pattern,
+)
+from interpreter.shm import SharedValues, load, prepare
+from interpreter.values import text
+
+
+def shard_of(name, shards):
+    # Stable across processes, unlike hash() of a str.
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+def execute(block, env, send, write, record=None):
+    # Runs a block in order. A send calls send(name, value) instead of
+    # splicing in the match, which is left to the actor's owner. Writes
+    # are reported as record(key, old, new).
+    for stmt in block:
+        A, op, B = stmt[0], stmt[1], stmt[2]
+        if op != ">":
+            continue
+        if isinstance(A, list) and any(
+            isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+        ):
+            for sub in A:
+                if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+                    pat, _, res = sub
+                    store_actor_pattern(env, B, [pat, res])
+                elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+                    store_actor_command(env, B, sub)
+            if record is not None:
+                record(tuple(B), None, ())
+        elif isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+            val = eval_value(A, env)
+            if B[1] == "print":
+                write(text(val) + "\n")
+            else:
+                send(B[1], val)
+        else:
+            key = tuple(B)
+            value = eval_value(A, env)
+            if record is not None:
+                record(key, env.get(key), value)
+            env[key] = value
+
+
+def deliver(env, name, val, send, write, record):
+    node = env.get((name,))
+    if not node or node[0] != "matchcases":
+        return
+    match = match_actor(env, [name], val)
+    if match is not None:
+        block = match[1]
+        if not (isinstance(block, list) and block and isinstance(block[0], list)):
+            block = [block]
+    else:
+        block = list(lookup_actor_commands(env, [name]) or [])
+    execute(block, env, send, write, record)
+
+
+def worker(conn, env, shard, shards, deterministic, batch):
+    store = SharedValues(shard)
+    queue = deque()
+    out = []
+    lines = []
+    written = set()
+    # (owner, name) of every handle loaded since the last report.
+    released = []
+    created = [0]
+
+    def send(name, val):
+        if not deterministic and shard_of(name, shards) == shard:
+            queue.append((name, val))
+            created[0] += 1
+        else:
+            out.append((name, store.export(val)))
+
+    def record(key, old, new):
+        written.add(key)
+        store.written(old, new)
+
+    try:
+        env = {key: load(value, released) for key, value in env.items()}
+        for value in env.values():
+            store.written(None, value)
+        while True:
+            received = 0
+            if not queue or conn.poll():
+                msg = conn.recv()
+                received = 1
+                if msg[0] == "stop":
+                    delta = {key: store.export(env[key]) for key in written}
+                    conn.send(("env", delta))
+                    # The parent reads the segments before saying bye.
+                    conn.recv()
+                    return
+                for name in msg[2]:
+                    store.release(name)
+                queue.extend((name, load(val, released)) for name, val in msg[1])
+            limit = len(queue) if deterministic else batch
+            processed = 0
+            while queue and processed < limit:
+                name, val = queue.popleft()
+                deliver(env, name, val, send, lines.append, record)
+                processed += 1
+            conn.send(("report", out, created[0], processed, received, lines, released))
+            out, lines, released = [], [], []
+            created[0] = 0
+    except (EOFError, OSError):
+        # The parent has gone away.
+        pass
+    except Exception as e:
+        try:
+            conn.send(("error", e))
+        except Exception:
+            conn.send(("error", Exception(str(e))))
+    finally:
+        store.close()
+
+
+def run(state, workers=None, deterministic=False, batch=256, write=None):
+    # Same interface as core.run().
+    if state[5]:
+        return state
+    write = write or output.sink.write
+    shards = workers or os.cpu_count() or 1
+    env = state[3]
+    store = SharedValues(-1)
+    initial = []
+    execute(state[1], env, lambda name, val: initial.append((name, store.export(val))), write)
+
+    ctx = multiprocessing.get_context()
+    prepare()
+    conns, procs = [], []
+    try:
+        for shard in range(shards):
+            parent, child = ctx.Pipe()
+            snapshot = {key: store.export(value) for key, value in env.items()}
+            proc = ctx.Process(
+                target=worker,
+                args=(child, snapshot, shard, shards, deterministic, batch),
+                daemon=True,
+            )
+            proc.start()
+            child.close()
+            conns.append(parent)
+            procs.append(proc)
+
+        if deterministic:
+            run_rounds(conns, initial, write, store)
+        else:
+            run_free(conns, initial, write, store)
+
+        for conn in conns:
+            conn.send(("stop",))
+        for conn in conns:
+            reply = receive(conns, conn)
+            for key, value in reply[1].items():
+                env[key] = load(value, [])
+        for conn in conns:
+            conn.send(("bye",))
+    finally:
+        store.close()
+        output.flush()
+        for conn in conns:
+            conn.close()
+        for proc in procs:
+            proc.join(timeout=1)
+            if proc.is_alive():
+                proc.terminate()
+    state[1], state[5] = [], True
+    return state
+
+
+def receive(conns, conn):
+    try:
+        reply = conn.recv()
+    except EOFError:
+        raise Exception(f"shard {conns.index(conn)} exited unexpectedly")
+    if reply[0] == "error":
+        raise reply[1]
+    return reply
+
+
+def split(msgs, shards):
+    groups = [[] for _ in range(shards)]
+    for name, val in msgs:
+        groups[shard_of(name, shards)].append((name, val))
+    return groups
+
+
+def settle(released, store, returns):
+    # Hands loaded handles back to their owners: the parent's at once, a
+    # worker's along with the next message it is sent.
+    for owner, name in released:
+        if owner < 0:
+            store.release(name)
+        else:
+            returns[owner].append(name)
+
+
+def forward(conn, outbox):
+    while True:
+        item = outbox.get()
+        if item is None:
+            return
+        conn.send(item)
+
+
+def run_free(conns, msgs, write, store):
+    # Workers report whenever they like, so sends go through one thread per
+    # pipe: the main thread never blocks on a full pipe and keeps reading,
+    # which a worker blocked on its own report needs.
+    outboxes = [queues.SimpleQueue() for _ in conns]
+    threads = [
+        threading.Thread(target=forward, args=(conn, outbox), daemon=True)
+        for conn, outbox in zip(conns, outboxes)
+    ]
+    for thread in threads:
+        thread.start()
+    # Messages not yet handled anywhere, and pipe messages a worker has not
+    # reported on yet (some only hand back handles). The run is over when
+    # both are zero; a report still on its way would be read as the reply
+    # to "stop".
+    pending = 0
+    unanswered = 0
+
+    def route(msgs, released):
+        nonlocal pending, unanswered
+        pending += len(msgs)
+        returns = [[] for _ in conns]
+        settle(released, store, returns)
+        for outbox, group, names in zip(outboxes, split(msgs, len(conns)), returns):
+            if group or names:
+                outbox.put(("msgs", group, names))
+                unanswered += 1
+
+    try:
+        route(msgs, [])
+        while pending or unanswered:
+            for conn in wait(conns):
+                _, out, created, processed, received, lines, released = receive(conns, conn)
+                if lines:
+                    write("".join(lines))
+                pending += created - processed
+                unanswered -= received
+                route(out, released)
+    finally:
+        for outbox in outboxes:
+            outbox.put(None)
+        for thread in threads:
+            thread.join(timeout=1)
+
+
+def run_rounds(conns, msgs, write, store):
+    inbox = split(msgs, len(conns))
+    returns = [[] for _ in conns]
+    while any(inbox):
+        for conn, group, names in zip(conns, inbox, returns):
+            conn.send(("msgs", group, names))
+        sent = []
+        returns = [[] for _ in conns]
+        for conn in conns:
+            _, out, _, _, _, lines, released = receive(conns, conn)
+            if lines:
+                write("".join(lines))
+            sent.extend(out)
+            settle(released, store, returns)
+        inbox = split(sent, len(conns))
@@ -0,0 +1,208 @@
+"""
+Shared-memory transfer of large strings between processes.
+
+Before a value crosses a pipe, export() replaces every string or rope
+storing at least THRESHOLD characters with a Handle: the name of a
+shared-memory segment that holds the UTF-8 text. A rope keeps its runs:
+the segment holds each run's text once and the handle lists the run
+layout, so a unary number is never expanded. A handle pickles to a few
+dozen bytes, however large the text is. The receiver calls load() to read the text
+straight out of the segment, and reports the handle's name back to the
+owner, which is the process that created it.
+
+The owner counts outstanding handles per segment. Sending the same
+string again, for example broadcasting a big env value, reuses its
+segment. A segment is unlinked when no handle is outstanding and no env
+entry holds its string any more. Workers report every env write through
+written(), so overwriting an entry frees its segments.
+"""
+import os
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+from interpreter.core import Actor, new_node
+from interpreter.values import Rope
+
+# Strings shorter than this are pickled as usual.
+THRESHOLD = 1 << 16
+
+
+class Handle:
+    # layout is None for a str, and a tuple of (encoded size, count) per
+    # run for a rope.
+    __slots__ = ("name", "size", "owner", "layout")
+
+    def __init__(self, name, size, owner, layout=None):
+        self.name = name
+        self.size = size
+        self.owner = owner
+        self.layout = layout
+
+    def __getstate__(self):
+        return self.name, self.size, self.owner, self.layout
+
+    def __setstate__(self, state):
+        self.name, self.size, self.owner, self.layout = state
+
+    def __repr__(self):
+        return f"<Handle {self.name} of {self.size} bytes from {self.owner}>"
+
+
+def open_segment(name=None, size=0):
+    # A new segment stays registered with the resource tracker, which
+    # unlinks it if its owner dies without freeing it. Every process must
+    # share one tracker (see prepare()), or a worker's own tracker would
+    # unlink segments it merely attached to when it exits.
+    if name is None:
+        return SharedMemory(create=True, size=size)
+    try:
+        return SharedMemory(name, track=False)
+    except TypeError:
+        return SharedMemory(name)
+
+
+def prepare():
+    """Call before starting worker processes."""
+    if os.name == "posix":
+        resource_tracker.ensure_running()
+
+
+def is_large(item, threshold=THRESHOLD):
+    # What pickling would copy: a rope's run texts, not its full length.
+    if type(item) is str:
+        return len(item) >= threshold
+    if type(item) is Rope and len(item) >= threshold:
+        return sum(len(text) for text, _ in item.iter_runs()) >= threshold
+    return False
+
+
+def large_items(val, threshold=THRESHOLD):
+    for item in val:
+        if isinstance(item, list):
+            yield from large_items(item, threshold)
+        elif is_large(item, threshold):
+            yield item
+
+
+def read(handle):
+    segment = open_segment(handle.name)
+    try:
+        with segment.buf[: handle.size] as view:
+            if handle.layout is None:
+                return str(view, "utf-8")
+            runs = []
+            length = pos = 0
+            for size, count in handle.layout:
+                text = str(view[pos : pos + size], "utf-8")
+                runs.append((text, count))
+                length += len(text) * count
+                pos += size
+    finally:
+        segment.close()
+    last, count = runs.pop()
+    return Rope(runs, len(runs), last, count, length)
+
+
+def load(val, released):
+    """val with every Handle replaced by its text; the handles' (owner,
+    name) pairs are appended to released."""
+    if type(val) is Actor:
+        return new_node(load(val[1], released), load(val[2], released))
+    if not any(isinstance(item, (Handle, list)) for item in val):
+        return val
+    result = []
+    for item in val:
+        if isinstance(item, Handle):
+            result.append(read(item))
+            released.append((item.owner, item.name))
+        elif isinstance(item, list):
+            result.append(load(item, released))
+        else:
+            result.append(item)
+    return result
+
+
+class SharedValues:
+    def __init__(self, owner, threshold=THRESHOLD):
+        self.owner = owner
+        self.threshold = threshold
+        # id(text) -> [text, segment, size, layout, outstanding handles];
+        # the text is kept alive so its id is not reused while it has a
+        # segment.
+        self.segments = {}
+        self.names = {}
+        # id(text) -> number of env entries holding it.
+        self.live = {}
+
+    def export(self, val):
+        """val with large strings replaced by handles."""
+        if type(val) is Actor:
+            return new_node(self.export(val[1]), self.export(val[2]))
+        threshold = self.threshold
+        if not any(isinstance(item, list) or is_large(item, threshold) for item in val):
+            return val
+        result = []
+        for item in val:
+            if isinstance(item, list):
+                result.append(self.export(item))
+            elif is_large(item, threshold):
+                result.append(self.share(item))
+            else:
+                result.append(item)
+        return result
+
+    def share(self, item):
+        entry = self.segments.get(id(item))
+        if entry is None:
+            if type(item) is Rope:
+                parts = [(text.encode("utf-8"), count) for text, count in item.iter_runs()]
+                data = b"".join([part for part, _ in parts])
+                layout = tuple([(len(part), count) for part, count in parts])
+            else:
+                data = item.encode("utf-8")
+                layout = None
+            segment = open_segment(size=max(1, len(data)))
+            segment.buf[: len(data)] = data
+            entry = self.segments[id(item)] = [item, segment, len(data), layout, 0]
+            self.names[segment.name] = id(item)
+        entry[4] += 1
+        return Handle(entry[1].name, entry[2], self.owner, entry[3])
+
+    def release(self, name):
+        key = self.names.get(name)
+        if key is None:
+            return
+        entry = self.segments[key]
+        entry[4] -= 1
+        if not entry[4] and key not in self.live:
+            self.free(key)
+
+    def written(self, old, new):
+        """Record that an env entry changed from old (None if unset) to new."""
+        for item in large_items(new, self.threshold):
+            self.live[id(item)] = self.live.get(id(item), 0) + 1
+        if old is None:
+            return
+        for item in large_items(old, self.threshold):
+            key = id(item)
+            count = self.live.get(key, 0) - 1
+            if count > 0:
+                self.live[key] = count
+                continue
+            self.live.pop(key, None)
+            entry = self.segments.get(key)
+            if entry is not None and not entry[4]:
+                self.free(key)
+
+    def free(self, key):
+        segment = self.segments.pop(key)[1]
+        del self.names[segment.name]
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        for key in list(self.segments):
+            self.free(key)
@@ -0,0 +1,201 @@
+"""
+Thread-pool engine: actor mailboxes are drained by a pool of threads.
+
+Sends enqueue the value on the target actor's mailbox, and an actor with
+mail is handed to the pool. At most one thread drains a given actor at a
+time, and it hands the actor back to the pool after `batch` messages so
+that busy actors cannot monopolize the threads. Instead of one lock
+around the env, every actor has its own lock, held while its definition
+is extended or a message is matched against it. Plain variable reads and
+writes are single dict operations, which are atomic on every build.
+
+On free-threaded CPython the actors run in parallel. On a build with the
+GIL the engine still works, but threads only interleave, so the default
+there is a single thread.
+
+    python -m interpreter.threads [actors] [messages]
+
+times an actor-heavy program with 1 to `actors` threads.
+"""
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from interpreter import output
+from interpreter.core import (
+    eval_value,
+    lookup_actor_commands,
+    match_actor,
+    store_actor_command,
+    store_actor_pattern,
+)
+from interpreter.values import text
+
+
+def gil_enabled():
+    check = getattr(sys, "_is_gil_enabled", None)
+    return True if check is None else check()
+
+
+class Actor:
+    __slots__ = ("lock", "mail_lock", "mailbox", "scheduled")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.mail_lock = threading.Lock()
+        self.mailbox = deque()
+        self.scheduled = False
+
+
+class Engine:
+    def __init__(self, env, threads, batch=64, write=None):
+        self.env = env
+        self.pool = ThreadPoolExecutor(threads)
+        self.batch = batch
+        self.write = write or output.sink.write
+        self.output = threading.Lock()
+        self.actors = {}
+        # Messages sent but not yet handled; the run is over at zero.
+        self.outstanding = 0
+        self.idle = threading.Condition()
+        self.error = None
+
+    def actor(self, key):
+        actor = self.actors.get(key)
+        if actor is None:
+            actor = self.actors.setdefault(key, Actor())
+        return actor
+
+    def send(self, key, val):
+        node = self.env.get(key)
+        if not node or node[0] != "matchcases":
+            # Not an actor when it is sent to: the message is dropped, as
+            # under step(), even if the actor is defined before it would
+            # have been delivered.
+            return
+        actor = self.actor(key)
+        with self.idle:
+            self.outstanding += 1
+        with actor.mail_lock:
+            actor.mailbox.append(val)
+            if actor.scheduled:
+                return
+            actor.scheduled = True
+        self.pool.submit(self.drain, key, actor)
+
+    def drain(self, key, actor):
+        for _ in range(self.batch):
+            with actor.mail_lock:
+                if not actor.mailbox:
+                    actor.scheduled = False
+                    return
+                val = actor.mailbox.popleft()
+            try:
+                if self.error is None:
+                    self.deliver(key, actor, val)
+            except Exception as e:
+                self.error = self.error or e
+            finally:
+                with self.idle:
+                    self.outstanding -= 1
+                    if not self.outstanding or self.error is not None:
+                        self.idle.notify_all()
+        # Still has mail: go to the back of the pool's queue.
+        self.pool.submit(self.drain, key, actor)
+
+    def deliver(self, key, actor, val):
+        env = self.env
+        with actor.lock:
+            node = env.get(key)
+            if not node or node[0] != "matchcases":
+                return
+            match = match_actor(env, list(key), val)
+            if match is not None:
+                block = match[1]
+                if not (isinstance(block, list) and block and isinstance(block[0], list)):
+                    block = [block]
+            else:
+                block = list(lookup_actor_commands(env, list(key)) or [])
+        self.execute(block)
+
+    def execute(self, block):
+        env = self.env
+        for stmt in block:
+            A, op, B = stmt[0], stmt[1], stmt[2]
+            if op != ">":
+                continue
+            if isinstance(A, list) and any(
+                isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+            ):
+                with self.actor(tuple(B)).lock:
+                    for sub in A:
+                        if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+                            pat, _, res = sub
+                            store_actor_pattern(env, B, [pat, res])
+                        elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+                            store_actor_command(env, B, sub)
+            elif isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+                val = eval_value(A, env)
+                if B[1] == "print":
+                    line = text(val) + "\n"
+                    with self.output:
+                        self.write(line)
+                else:
+                    self.send((B[1],), val)
+            else:
+                env[tuple(B)] = eval_value(A, env)
+
+    def wait(self):
+        with self.idle:
+            while self.outstanding and self.error is None:
+                self.idle.wait()
+
+
+def run(state, threads=None, batch=64, write=None):
+    # Same interface as core.run().
+    if state[5]:
+        return state
+    if threads is None:
+        threads = 1 if gil_enabled() else os.cpu_count() or 1
+    engine = Engine(state[3], threads, batch, write)
+    try:
+        engine.execute(state[1])
+        engine.wait()
+    finally:
+        engine.pool.shutdown(wait=True, cancel_futures=True)
+        output.flush()
+    if engine.error is not None:
+        raise engine.error
+    state[1], state[5] = [], True
+    return state
+
+
+# --- BENCHMARK ---
+if __name__ == "__main__":
+    import io
+    import time
+    from interpreter.parser import desugar, group_statements, parse
+
+    actors = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    messages = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    lines = []
+    for i in range(actors):
+        lines.append(f'"" > d{i}')
+        lines.append(f'"{"a" * messages}" > m{i}')
+        lines.append(
+            f'[ "s" => [ [[d{i} "a"] > d{i}] [d{i} > @w{i}] ] '
+            f'[m{i}] => [ ["w{i} done" > @print] ] "s" > @w{i} ] > w{i}'
+        )
+    lines.extend(f'"s" > @w{i}' for i in range(actors))
+    prog = group_statements(desugar(parse("\n".join(lines))))
+    print(f"{actors} actors x {messages} messages, GIL {'on' if gil_enabled() else 'off'}")
+    base = None
+    for n in range(1, actors + 1):
+        state = ["program", prog, "env", {}, "done", False]
+        start = time.perf_counter()
+        run(state, threads=n, write=io.StringIO().write)
+        elapsed = time.perf_counter() - start
+        base = base or elapsed
+        print(f"{n:3d} threads {elapsed:.3f}s  x{base / elapsed:.2f}")
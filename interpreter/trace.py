@@ -0,0 +1,276 @@
+"""
+Step traces of the stack engine, and replay to any step.
+
+record() runs a program like core.run() while logging what every
+statement did, so that a long run can be inspected afterwards at any
+step without running it again. A trace file starts with MAGIC and holds
+records framed like checkpoint records:
+
+    kind (b"K" keyframe, b"D" deltas) | u32 length | u32 crc32 | payload
+
+A keyframe is a full checkpoint payload (continuation and env, see
+checkpoint.Writer) taken every `keyframe_every` steps and once at the
+end. A delta record is the number of its first step and a step count,
+followed by one entry per step:
+
+    SKIP             nothing changed (a print, or a send nobody handled)
+    WRITE value      the statement assigned value to its target
+    DEFINE           it extended an actor with its patterns and commands
+    PUSH block       a send matched; block runs next
+    APPEND           an unmatched send queued the actor's commands
+
+The statement itself is not logged: it is always the next one in the
+continuation, which replay keeps in step. Values share the checkpoint
+encoding, whose string and list tables restart at every keyframe, so
+replay(path, n) decodes from the last keyframe at or before step n and
+applies the deltas after it without evaluating anything.
+
+    arrow --trace run.trace prog.ar
+    python -m interpreter.trace run.trace 120000
+"""
+import os
+import sys
+import zlib
+
+from interpreter.checkpoint import RECORD, Reader, Writer, get_varint, put_varint
+from interpreter.core import (
+    load,
+    lookup_actor_commands,
+    pending,
+    store_actor_command,
+    store_actor_pattern,
+)
+from interpreter import output
+from interpreter.hooks import Hooks
+from interpreter.values import is_text, text
+
+MAGIC = b"ARTR\x01"
+
+# Steps between keyframes.
+KEYFRAME_EVERY = 100_000
+
+# Delta bytes buffered before a record is written.
+BATCH = 1 << 16
+
+SKIP, WRITE, DEFINE, PUSH, APPEND = range(5)
+
+
+class Recorder:
+    def __init__(self, path, keyframe_every=KEYFRAME_EVERY):
+        self.keyframe_every = keyframe_every
+        self.writer = Writer(path)
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.out = bytearray()
+        self.first = 0
+
+    def emit(self, kind, payload):
+        self.file.write(kind + RECORD.pack(len(payload), zlib.crc32(payload)) + payload)
+
+    def flush(self, steps):
+        # Writes the deltas of the steps before `steps`.
+        if steps > self.first:
+            head = bytearray()
+            put_varint(head, self.first)
+            put_varint(head, steps - self.first)
+            self.emit(b"D", head + self.out)
+            self.out = bytearray()
+        self.first = steps
+
+    def keyframe(self, cont, env, steps, done):
+        self.flush(steps)
+        self.writer.reset()
+        self.emit(b"K", self.writer.payload(cont, env, steps, done))
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def execute_recorded(cont, env, recorder, steps=0, cache=None):
+    # core.execute() to completion through the hooks loop, logging every
+    # statement. Returns the total step count.
+    put = recorder.writer.put
+    every = recorder.keyframe_every
+    next_keyframe = steps + every
+    out = recorder.out
+    # The block the current statement's send matched, if any.
+    pushed = None
+    hooks = Hooks()
+
+    @hooks.on("match")
+    def match(name, val, pat, result):
+        nonlocal pushed
+        pushed = result
+
+    @hooks.on("statement")
+    def statement(stmt, env):
+        nonlocal steps, next_keyframe, out, pushed
+        steps += 1
+        A, op, B = stmt[0], stmt[1], stmt[2]
+        if op != ">":
+            out.append(SKIP)
+        elif isinstance(A, list) and any(
+            isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+        ):
+            out.append(DEFINE)
+        elif isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+            if pushed is not None:
+                out.append(PUSH)
+                put(out, pushed)
+                pushed = None
+            elif B[1] != "print" and lookup_actor_commands(env, [B[1]]):
+                out.append(APPEND)
+            else:
+                out.append(SKIP)
+        else:
+            out.append(WRITE)
+            put(out, env[tuple(B)])
+        if steps == next_keyframe or len(out) >= BATCH:
+            recorder.out = out
+            if steps == next_keyframe:
+                recorder.keyframe(cont, env, steps, False)
+                next_keyframe += every
+            else:
+                recorder.flush(steps)
+            out = recorder.out
+
+    recorder.keyframe(cont, env, steps, False)
+    try:
+        hooks.execute(cont, env, None, cache)
+    except BaseException:
+        # The statement that raised logged nothing; keep the steps before
+        # it, which are what a failed run is inspected for.
+        recorder.out = out
+        recorder.flush(steps)
+        raise
+    recorder.out = out
+    recorder.keyframe(cont, env, steps, True)
+    return steps
+
+
+def define(env, A, B):
+    for sub in A:
+        if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+            pat, _, res = sub
+            store_actor_pattern(env, B, [pat, res])
+        elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+            store_actor_command(env, B, sub)
+
+
+def splice(frames, frame, result):
+    # A matched result runs next, as in core.execute().
+    if not (isinstance(result, list) and result and isinstance(result[0], list)):
+        result = [result]
+    if frame is not None and frame[1] == len(frame[0]):
+        frame[0], frame[1] = result, 0
+    else:
+        frames.append([result, 0])
+
+
+def record(state, path, keyframe_every=KEYFRAME_EVERY, cache=None):
+    # Same interface as core.run(), with a trace.
+    if state[5]:
+        return state
+    recorder = Recorder(path, keyframe_every)
+    try:
+        execute_recorded(load(state[1]), state[3], recorder, 0, cache)
+    finally:
+        recorder.close()
+        output.flush()
+    state[1], state[5] = [], True
+    return state
+
+
+def read_records(data):
+    # (kind, payload) of every intact record, up to the first damaged one.
+    if bytes(data[: len(MAGIC)]) != MAGIC:
+        raise Exception("not an arrow trace file")
+    pos = len(MAGIC)
+    header = 1 + RECORD.size
+    while pos + header <= len(data):
+        kind = bytes(data[pos : pos + 1])
+        length, crc = RECORD.unpack_from(data, pos + 1)
+        payload = data[pos + header : pos + header + length]
+        if kind not in (b"K", b"D") or len(payload) != length or zlib.crc32(payload) != crc:
+            return
+        yield kind, payload
+        pos += header + length
+
+
+def apply(cont, env, kind, buf, pos, reader):
+    # Replays one step; returns the position after its entry.
+    frames, tail = cont
+    while True:
+        if frames:
+            frame = frames[-1]
+            block, i = frame
+            if i >= len(block):
+                frames.pop()
+                continue
+            stmt = block[i]
+            frame[1] = i + 1
+        elif tail:
+            stmt = tail.popleft()
+            frame = None
+        else:
+            raise Exception("trace does not match its program")
+        break
+    A, B = stmt[0], stmt[2]
+    if kind == WRITE:
+        env[tuple(B)], pos = reader.get(buf, pos)
+    elif kind == DEFINE:
+        define(env, A, B)
+    elif kind == PUSH:
+        result, pos = reader.get(buf, pos)
+        splice(frames, frame, result)
+    elif kind == APPEND:
+        tail.extend(lookup_actor_commands(env, [B[1]]))
+    return pos
+
+
+def replay(path, step=None):
+    """The state after `step` statements of a recorded run (the end of the
+    trace if None): ["program", pending, "env", env, "done", done]."""
+    with open(path, "rb") as f:
+        data = memoryview(f.read())
+    records = list(read_records(data))
+    start = None
+    for n, (kind, payload) in enumerate(records):
+        if kind == b"K" and (step is None or get_varint(payload, 0)[0] <= step):
+            start = n
+    if start is None:
+        raise Exception("trace file holds no keyframe")
+    reader = Reader()
+    env = {}
+    cont, steps, _ = reader.read_state(records[start][1], env)
+    for kind, payload in records[start + 1 :]:
+        if kind == b"K" or steps == step:
+            break
+        first, pos = get_varint(payload, 0)
+        if first != steps:
+            raise Exception(f"trace is missing steps {steps} to {first}")
+        count, pos = get_varint(payload, pos)
+        for _ in range(count if step is None else min(count, step - steps)):
+            kind = payload[pos]
+            pos = apply(cont, env, kind, payload, pos + 1, reader)
+            steps += 1
+    if step is not None and steps < step:
+        raise Exception(f"trace ends at step {steps}")
+    prog = pending(cont)
+    return ["program", prog, "env", env, "done", not prog]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or not os.path.exists(sys.argv[1]):
+        print("Usage: python -m interpreter.trace <file.trace> [step]")
+        sys.exit(1)
+    state = replay(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
+    prog, env = state[1], state[3]
+    print(f"next: {prog[0] if prog else 'nothing (done)'}")
+    for key, val in env.items():
+        if isinstance(val, list) and val and val[0] == "matchcases":
+            print(f"{' '.join(key)}: actor with {len(val[1])} patterns")
+        else:
+            shown = text(val) if all(is_text(x) for x in val) else str(val)
+            print(f"{' '.join(key)} = {shown[:200]}")
@@ -0,0 +1,300 @@
+"""
+Transpile grouped Arrow programs into standalone Python modules.
+
+Every statement block (the program, each match result and each command)
+becomes a generator function. A send that matches yields the block to run
+next, so the driver in main() keeps an explicit frame stack of generators
+and a deque for appended commands, just like core.execute(). A send that
+ends a block returns its target instead, which replaces the finished
+frame so actor loops run in constant space. Actors are
+dispatched through a dict from message value to the first constant pattern
+that matches; only patterns that read variables are scanned.
+"""
+import hashlib
+import importlib.util
+import os
+import re
+
+from interpreter import output
+from interpreter.core import assigned_keys, coalesce
+from interpreter.parser import desugar, group_statements, parse
+from interpreter.values import Rope
+
+# Part of the cache key, bump whenever the generated code changes shape.
+FORMAT = "2"
+
+RUNTIME = '''\
+import sys
+from collections import deque
+
+
+def coalesce(result):
+    i = 0
+    while i < len(result):
+        if isinstance(result[i], str):
+            combined = result[i]
+            j = i + 1
+            while j < len(result) and isinstance(result[j], str):
+                combined += result[j]
+                j += 1
+            if j > i + 1:
+                result[i:j] = [combined]
+        i += 1
+    return result
+
+
+def matchcases():
+    # ["matchcases", patterns, commands, [table, dynamic, shapes]]: table
+    # maps a constant pattern value to its first position, dynamic lists the
+    # positions of patterns that have to be evaluated at send time, and
+    # shapes holds the item lengths of the constants so that messages that
+    # cannot match are rejected without hashing them.
+    return ["matchcases", [], [], [{}, [], set()]]
+
+
+def define_pattern(key, entry):
+    node = env.get(key)
+    if node is None or node[0] != "matchcases":
+        node = env[key] = matchcases()
+    table, dynamic, shapes = node[3]
+    if entry[1] is None:
+        table.setdefault(tuple(entry[0]), len(node[1]))
+        shapes.add(tuple(map(len, entry[0])))
+    else:
+        dynamic.append(len(node[1]))
+    node[1].append(entry)
+
+
+def define_command(key, block):
+    node = env.get(key)
+    if node is None or node[0] != "matchcases":
+        node = env[key] = matchcases()
+    node[2].append(block)
+
+
+def send(key, val):
+    node = env.get(key)
+    if node and node[0] == "matchcases":
+        entries = node[1]
+        table, dynamic, shapes = node[3]
+        first = len(entries)
+        try:
+            if tuple(map(len, val)) in shapes:
+                first = table.get(tuple(val), first)
+        except TypeError:
+            pass
+        for i in dynamic:
+            if i > first:
+                break
+            if entries[i][1]() == val:
+                return entries[i][2]
+        if first < len(entries):
+            return entries[first][2]
+        if node[2]:
+            tail.extend(node[2])
+    return None
+'''
+
+DRIVER = '''
+
+def main(initial_env=None, out=None):
+    global env, get, tail, write
+    env = {} if initial_env is None else initial_env
+    get = env.get
+    tail = deque()
+    write = (out or sys.stdout).write
+    frames = [b0()]
+    while True:
+        if frames:
+            frame = frames[-1]
+        elif tail:
+            frame = tail.popleft()()
+            frames.append(frame)
+        else:
+            return env
+        try:
+            block = next(frame)
+        except StopIteration as stop:
+            # A block ending in a matched send returns its target instead
+            # of yielding it, and the target takes over the frame.
+            if stop.value is None:
+                frames.pop()
+            else:
+                frames[-1] = stop.value()
+            continue
+        frames.append(block())
+
+
+if __name__ == "__main__":
+    main()
+'''
+
+
+def transpile(prog, source="<arrow>", env=None):
+    """Return the source of a Python module equivalent to the program."""
+    gen = Generator(assigned_keys(prog, env))
+    gen.block(prog)
+    lines = [f"# Generated by arrow from {source}. Do not edit.", RUNTIME]
+    lines.extend(f"{name} = {value}" for value, name in gen.constants.items())
+    lines.append("")
+    for body in gen.functions:
+        lines.append("")
+        lines.extend(body)
+    lines.append(DRIVER)
+    return "\n".join(lines)
+
+
+class Generator:
+    def __init__(self, written):
+        self.written = written
+        self.constants = {}
+        self.functions = []
+
+    def constant(self, value):
+        text = repr(value)
+        if text not in self.constants:
+            self.constants[text] = f"C{len(self.constants)}"
+        return self.constants[text]
+
+    def block(self, stmts):
+        # Reserve the name first so the program itself is always b0.
+        name = f"b{len(self.functions)}"
+        body = [f"def {name}():"]
+        self.functions.append(body)
+        for stmt in stmts:
+            self.statement(stmt, body)
+        if len(body) > 3 and body[-1] == "        yield target":
+            del body[-2:]
+            body[-1] = body[-1].replace("target = send(", "return send(", 1)
+        body.append("    yield from ()")
+        return name
+
+    def result(self, res):
+        if isinstance(res, list) and res and isinstance(res[0], list):
+            return self.block(res)
+        return self.block([res])
+
+    def expr(self, A):
+        # A Python expression for eval_value(A); names the program never
+        # writes are literals and fold into constants.
+        leaves = []
+        todo = [A]
+        while todo:
+            node = todo.pop()
+            if isinstance(node, list):
+                todo.extend(reversed(node))
+            else:
+                leaves.append(node)
+        if not any(isinstance(leaf, str) and (leaf,) in self.written for leaf in leaves):
+            value = coalesce(list(leaves))
+            # Generated modules use plain strings; fold ropes back into str.
+            return self.constant([str(x) if isinstance(x, Rope) else x for x in value]), True
+        items = []
+        for leaf in leaves:
+            if isinstance(leaf, str) and (leaf,) in self.written:
+                items.append(f"*get({(leaf,)!r}, {self.constant([leaf])})")
+            else:
+                items.append(repr(leaf))
+        if len(items) == 1:
+            return items[0][1:], False
+        items = ", ".join(items)
+        return f"coalesce([{items}])", False
+
+    def statement(self, stmt, body):
+        try:
+            A, op, B = stmt[0], stmt[1], stmt[2]
+        except (IndexError, KeyError, TypeError) as e:
+            body.append(f"    raise {type(e).__name__}({str(e)!r})")
+            return
+        if op != ">":
+            return
+        if isinstance(A, list) and any(
+            isinstance(x, list) and len(x) == 3 and x[1] == "=>" for x in A
+        ):
+            key = tuple(B) if isinstance(B, (list, str)) else B
+            for sub in A:
+                if isinstance(sub, list) and len(sub) == 3 and sub[1] == "=>":
+                    pat, _, res = sub
+                    target = self.result(res)
+                    value, const = self.expr(pat)
+                    if const:
+                        entry = f"[{value}, None, {target}]"
+                    else:
+                        entry = f"[None, lambda: {value}, {target}]"
+                    body.append(f"    define_pattern({key!r}, {entry})")
+                elif isinstance(sub, list) and len(sub) == 3 and sub[1] == ">":
+                    body.append(f"    define_command({key!r}, {self.block([sub])})")
+            return
+        value, _ = self.expr(A)
+        if isinstance(B, list) and len(B) >= 2 and B[0] == "@":
+            if B[1] == "print":
+                body.append(f'    write("".join({value}) + "\\n")')
+            else:
+                body.append(f"    target = send({(B[1],)!r}, {value})")
+                body.append("    if target is not None:")
+                body.append("        yield target")
+        else:
+            try:
+                key = tuple(B)
+                hash(key)
+            except TypeError as e:
+                body.append(f"    raise TypeError({str(e)!r})")
+                return
+            body.append(f"    env[{key!r}] = {value}")
+
+
+def load_module(path):
+    # Importing (rather than exec'ing the source) lets CPython cache the
+    # module's bytecode next to it.
+    name = "arrow_" + os.path.splitext(os.path.basename(path))[0].replace(".", "_")
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def cached_module(filepath, cache_dir=None):
+    """Load the transpiled module for an .ar file, regenerating it only when
+    the source has changed. Regenerating removes the file's older modules."""
+    with open(filepath, "r") as f:
+        code = f.read()
+    digest = hashlib.sha1((FORMAT + code).encode("utf-8")).hexdigest()[:16]
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(filepath)), "__arrowcache__")
+    stem = os.path.splitext(os.path.basename(filepath))[0]
+    path = os.path.join(cache_dir, f"{stem}.{digest}.py")
+    if not os.path.exists(path):
+        prog = group_statements(desugar(parse(code)))
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(transpile(prog, os.path.basename(filepath)))
+        os.replace(tmp, path)
+        prune(cache_dir, stem, path)
+    return load_module(path)
+
+
+def prune(cache_dir, stem, keep):
+    # Modules of earlier versions of the source, or of another FORMAT.
+    stale = re.compile(re.escape(stem) + r"\.[0-9a-f]{16}\.py")
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if stale.fullmatch(name) and path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def run(state):
+    # Same interface as core.run(): transpiles and runs without caching.
+    if state[5]:
+        return state
+    namespace = {"__name__": "arrow_program"}
+    exec(compile(transpile(state[1], env=state[3]), "<arrow>", "exec"), namespace)
+    try:
+        namespace["main"](state[3], output.sink)
+    finally:
+        output.flush()
+    state[1], state[5] = [], True
+    return state
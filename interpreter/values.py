@@ -0,0 +1,148 @@
+"""
+String values for the engine.
+
+Values are lists whose string items are either plain str or Rope. Short
+strings stay str; once a concatenation reaches ROPE_MIN characters it
+produces a Rope, an immutable run-length encoded string whose appends are
+amortized O(1). Unary numbers such as "a" * 10**7 are a single run, so
+they take a few bytes and compare in O(1). A rope is only flattened when
+its characters are needed: printing, hashing, or comparing against a
+differently laid out string of the same length.
+"""
+
+# Concatenations shorter than this stay plain str.
+ROPE_MIN = 256
+
+# Small appends are merged into a rope's last run up to this size.
+CHUNK = 1024
+
+
+class Rope:
+    # The characters are a sequence of runs (text, count), meaning
+    # text * count; a text made of one repeated character is always stored
+    # as that character with its length as the count, so unary numbers are
+    # a single run whatever their size. `runs` is a list shared by every
+    # rope derived from the same base: a rope uses only its first `n`
+    # entries and owns its last run (`last`, `count`) itself. The rope that
+    # uses the whole list may append to it in place, any other copies its
+    # prefix first, so no rope ever sees another's appends.
+    __slots__ = ("runs", "n", "last", "count", "length", "flat")
+
+    def __init__(self, runs, n, last, count, length):
+        self.runs = runs
+        self.n = n
+        self.last = last
+        self.count = count
+        self.length = length
+        self.flat = None
+
+    @classmethod
+    def of(cls, s):
+        if isinstance(s, Rope):
+            return s
+        if len(s) > 1 and s.count(s[0]) == len(s):
+            return cls([], 0, s[0], len(s), len(s))
+        return cls([], 0, s, 1, len(s))
+
+    def __len__(self):
+        return self.length
+
+    def iter_runs(self):
+        yield from self.runs[: self.n]
+        if self.last:
+            yield self.last, self.count
+
+    def flatten(self):
+        if self.flat is None:
+            self.flat = "".join([text * count for text, count in self.iter_runs()])
+        return self.flat
+
+    __str__ = flatten
+
+    def append(self, text, count=1):
+        """A rope with text * count appended."""
+        if not text or not count:
+            return self
+        if len(text) > 1 and text.count(text[0]) == len(text):
+            text, count = text[0], len(text) * count
+        length = self.length + len(text) * count
+        if text == self.last:
+            return Rope(self.runs, self.n, text, self.count + count, length)
+        if self.count == 1 and count == 1 and len(self.last) + len(text) <= CHUNK:
+            return Rope(self.runs, self.n, self.last + text, 1, length)
+        runs, n = self.runs, self.n
+        if self.last:
+            item = (self.last, self.count)
+            if n == len(runs):
+                runs.append(item)
+                # Another thread extending the same rope may have appended
+                # first; list.append is atomic, so whoever landed at n owns
+                # the shared list and the other copies.
+                if runs[n] is not item:
+                    runs = runs[:n] + [item]
+            else:
+                runs = runs[:n]
+                runs.append(item)
+            n += 1
+        return Rope(runs, n, text, count, length)
+
+    def __add__(self, other):
+        if isinstance(other, str):
+            return self.append(other)
+        if not isinstance(other, Rope):
+            return NotImplemented
+        rope = self
+        for text, count in other.iter_runs():
+            rope = rope.append(text, count)
+        return rope
+
+    def __radd__(self, other):
+        if not isinstance(other, str):
+            return NotImplemented
+        return Rope.of(other) + self
+
+    def __eq__(self, other):
+        # O(runs) unless the two sides are laid out differently.
+        if isinstance(other, Rope):
+            if self.length != other.length:
+                return False
+            if self.last == other.last and self.count == other.count:
+                if self.runs is other.runs and self.n == other.n:
+                    return True
+                if self.n == other.n and self.runs[: self.n] == other.runs[: other.n]:
+                    return True
+            return self.flatten() == other.flatten()
+        if isinstance(other, str):
+            if self.length != len(other):
+                return False
+            if not self.n and len(self.last) == 1:
+                return other.count(self.last) == self.length
+            return self.flatten() == other
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    def __hash__(self):
+        # Equal to the hash of the flat string, so ropes and strs can be
+        # looked up interchangeably.
+        return hash(self.flatten())
+
+    def __repr__(self):
+        return f"<Rope of {self.length} chars in {self.n + 1} runs>"
+
+
+def is_text(x):
+    return isinstance(x, (str, Rope))
+
+
+def concat(a, b):
+    if type(a) is str and type(b) is str and len(a) + len(b) < ROPE_MIN:
+        return a + b
+    return Rope.of(a) + b
+
+
+def text(val):
+    """The characters of a value, as @print writes them."""
+    return "".join([x.flatten() if type(x) is Rope else x for x in val])
@@ -9,7 +9,7 @@ setup(
             'arrow=arrow:main',
         ],
     },
-    python_requires='>=3.6',
+    python_requires='>=3.9',
     author="Arrow Developer",
     description="Arrow programming language interpreter",
 )
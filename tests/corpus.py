@@ -0,0 +1,134 @@
+"""Programs every engine must run like rewrite(), with their expected output
+and final env: a few fixed programs and seeded random ones that finish
+within STEPS steps without an error."""
+import copy
+import os
+import random
+
+from helpers import program
+
+from interpreter import output
+from interpreter.core import step
+from interpreter.values import Rope
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STEPS = 3000
+
+NAMES = ["x", "y", "a", "b", "step", "go", "n"]
+ACTORS = ["p", "q", "r"]
+
+FIXED = [
+    '''
+"stop" > someVar
+[
+  "stop" => [ ["stop matched" > @print] ]
+  "play" => [ ["log" > @print] ["play" > @myActor] ]
+] > myActor
+someVar > @myActor
+''',
+    '''
+"" > data
+"aaaaaaaaaa" > number
+[ "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] [data > @print] ]
+  "step" > @count ] > count
+"step" > @count
+''',
+    '''
+"early" > @x
+[ "early" => [ ["got early" > @print] ] ] > x
+x > y
+"early" > @y
+"late" > @print
+''',
+]
+
+
+def random_value(rng, depth=0):
+    value = []
+    for _ in range(rng.randint(1, 3)):
+        if depth < 2 and rng.random() < 0.2:
+            value.append(random_value(rng, depth + 1))
+        else:
+            value.append([rng.choice(NAMES + ["", "a", "zz"])])
+    return value
+
+
+def random_statement(rng, depth):
+    r = rng.random()
+    if r < 0.3:
+        return [random_value(rng), ">", [rng.choice(NAMES)]]
+    if r < 0.45:
+        return [random_value(rng), ">", ["@", "print"]]
+    if r < 0.75:
+        return [random_value(rng), ">", ["@", rng.choice(ACTORS)]]
+    if depth < 2:
+        subs = []
+        for _ in range(rng.randint(1, 4)):
+            if rng.random() < 0.7:
+                body = [random_statement(rng, depth + 1) for _ in range(rng.randint(1, 3))]
+                subs.append([random_value(rng), "=>", body])
+            else:
+                subs.append(random_statement(rng, depth + 1))
+        return [subs, ">", [rng.choice(ACTORS)]]
+    return [random_value(rng), ">", [rng.choice(NAMES)]]
+
+
+def random_program(seed):
+    rng = random.Random(seed)
+    return [random_statement(rng, 0) for _ in range(rng.randint(2, 12))]
+
+
+def plain(env):
+    """The env's variables (not its actors), with ropes as strings."""
+    out = {}
+    for key, value in env.items():
+        value = [str(x) if isinstance(x, Rope) else x for x in value]
+        if all(isinstance(x, str) for x in value):
+            out[key] = value
+    return out
+
+
+def reference(prog):
+    """(lines, env) after running prog with step(), or None if it errors or
+    runs for more than STEPS steps."""
+    state = ["program", copy.deepcopy(prog), "env", {}, "done", False]
+    with output.use(output.ListSink()) as sink:
+        try:
+            for _ in range(STEPS):
+                state, changed = step(state)
+                if not changed:
+                    break
+            else:
+                return None
+        except Exception:
+            return None
+    return sink.lines, plain(state[3])
+
+
+def build(seeds=200):
+    with open(os.path.join(ROOT, "test.ar")) as f:
+        progs = [program(f.read())] + [program(source) for source in FIXED]
+    progs += [random_program(seed) for seed in range(seeds)]
+    cases = []
+    for prog in progs:
+        expected = reference(prog)
+        if expected is not None:
+            cases.append((prog, expected))
+    return cases
+
+
+CASES = build()
+
+
+def check(engine, *args, **kwargs):
+    """Run every case on engine; returns the indexes of those that differ."""
+    bad = []
+    for i, (prog, expected) in enumerate(CASES):
+        state = ["program", copy.deepcopy(prog), "env", {}, "done", False]
+        with output.use(output.ListSink()) as sink:
+            engine(state, *args, **kwargs)
+        if (sink.lines, plain(state[3])) != expected:
+            bad.append(i)
+    return bad
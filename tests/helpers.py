@@ -0,0 +1,54 @@
+"""Shared helpers for the tests: programs from source and captured runs."""
+from interpreter import output
+from interpreter.parser import desugar, group_statements, parse
+
+
+def program(source):
+    return group_statements(desugar(parse(source)))
+
+
+def state(source, env=None):
+    return ["program", program(source), "env", {} if env is None else env, "done", False]
+
+
+def printed(engine, st, *args, **kwargs):
+    """Run st with engine; returns the printed lines."""
+    with output.use(output.ListSink()) as sink:
+        engine(st, *args, **kwargs)
+    return sink.lines
+
+
+# A program run in three parts, each of which may go to a different engine:
+# actors defined by one part are sent to by the next.
+DEFINE = '''
+"" > n
+[
+  "hi" => [ ["x got hi" > @print] [[n "a"] > n] ]
+  "cmd" > @print
+] > x
+'''
+
+SEND = '''
+"hi" > @x
+"nope" > @x
+[ "yo" => [ ["y got yo" > @print] ] ] > y
+x > z
+"hi" > @z
+'''
+
+FINISH = '''
+"yo" > @y
+"hi" > @x
+n > @print
+'''
+
+EXPECTED = ["x got hi", "x got hi", "cmd", "y got yo", "x got hi", "aaa"]
+
+
+def continued(engines):
+    st = state(DEFINE)
+    lines = []
+    for engine, source in zip(engines, (DEFINE, SEND, FINISH)):
+        st[1], st[5] = program(source), False
+        lines += printed(engine, st)
+    return lines, st[3]
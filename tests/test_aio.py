@@ -0,0 +1,61 @@
+import asyncio
+
+from helpers import EXPECTED, continued, printed, state
+
+from interpreter import aio, output
+from interpreter.core import rewrite, run
+
+COUNTER = '''
+"" > data
+"aaaa" > number
+[
+  "step" => [ ["always" > @print] [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def test_single_actor_runs_like_rewrite():
+    st, expected = state(COUNTER), state(COUNTER)
+    assert printed(aio.run, st) == printed(rewrite, expected)
+    assert st[3] == expected[3]
+
+
+def test_messages_to_one_actor_keep_their_order():
+    source = '''
+[ "1" => [ ["one" > @print] ] "2" => [ ["two" > @print] ] "3" => [ ["three" > @print] ] ] > p
+"1" > @p
+"2" > @p
+"3" > @p
+"2" > @p
+'''
+    assert printed(aio.run, state(source), yield_every=1) == ["one", "two", "three", "two"]
+
+
+def test_other_coroutines_run_while_a_program_is_busy():
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.ensure_future(ticker())
+        await aio.run_async(state(COUNTER.replace('"aaaa"', '"' + "a" * 2000 + '"')), yield_every=10)
+        task.cancel()
+
+    with output.use(output.NullSink()):
+        asyncio.run(main())
+    assert len(ticks) > 100
+
+
+def test_state_moves_between_aio_and_core():
+    _, env = continued([rewrite, rewrite, rewrite])
+    lines, other = continued([aio.run, run, aio.run])
+    assert other == env
+    # Actors run alongside the program, so the last part may print n
+    # before x has handled its message.
+    assert sorted(line for line in lines if not line.startswith("a")) == sorted(EXPECTED[:-1])
@@ -0,0 +1,55 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import corpus
+from helpers import printed, program
+
+from benchmarks.workloads import PARSE_ONLY, WORKLOADS
+from interpreter import closures, compiler
+from interpreter.core import run
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SIZES = {"counter": 50, "match_cases": 10, "deep_nesting": 10, "fan_out": 10, "huge_string": 10, "flat": 100}
+
+
+@pytest.mark.parametrize("name", sorted(set(WORKLOADS) - PARSE_ONLY))
+def test_workloads_run_alike_on_every_engine(name):
+    # Workloads do a fixed amount of work at any size, too much for
+    # rewrite(); the stack engine is checked against it on the corpus.
+    source = WORKLOADS[name][0](SIZES[name])
+    st = ["program", program(source), "env", {}, "done", False]
+    expected = printed(run, st), corpus.plain(st[3])
+    for engine in (compiler.run, closures.run):
+        st = ["program", program(source), "env", {}, "done", False]
+        assert (printed(engine, st), corpus.plain(st[3])) == expected
+
+
+def bench(*args):
+    return subprocess.run(
+        [sys.executable, os.path.join(ROOT, "benchmarks", "run.py"), "--quick", "--repeat", "1", *args],
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+
+def test_baseline_comparison_flags_regressions(tmp_path):
+    baseline = str(tmp_path / "baseline.json")
+    assert bench("counter", "--save", "--baseline", baseline).returncode == 0
+    with open(baseline) as f:
+        saved = json.load(f)
+    assert list(saved["results"]) == ["counter-1000"]
+    assert bench("counter", "--baseline", baseline, "--threshold", "100").returncode == 0
+    # A baseline a thousand times faster makes every phase a regression.
+    for result in saved["results"].values():
+        result["seconds"] = {phase: seconds / 1000 for phase, seconds in result["seconds"].items()}
+    with open(baseline, "w") as f:
+        json.dump(saved, f)
+    slower = bench("counter", "--baseline", baseline)
+    assert slower.returncode == 1
+    assert "REGRESSION" in slower.stdout
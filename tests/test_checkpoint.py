@@ -0,0 +1,81 @@
+import copy
+
+import corpus
+from helpers import printed, state
+
+from interpreter import checkpoint, output
+from interpreter.core import Actor, execute, load, rewrite
+
+COUNTER = '''
+"" > data
+"aaaaaaaaaaaaaaaaaaaa" > number
+[
+  "step" => [ ["tick" > @print] [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def interrupted(prog, path, cut, every=3):
+    # Runs `cut` checkpoints' worth of prog, as if the process then died;
+    # returns the lines printed so far.
+    cont, env = load(prog), {}
+    writer = checkpoint.Writer(str(path), full_every=2)
+    steps = 0
+    with output.use(output.ListSink()) as sink:
+        for _ in range(cut):
+            n = execute(cont, env, every)
+            steps += n
+            writer.write(cont, env, steps, n < every)
+            if n < every:
+                break
+    writer.close()
+    return sink.lines
+
+
+def test_resume_finishes_the_corpus_like_rewrite(tmp_path):
+    path = tmp_path / "run.ckpt"
+    for prog, (lines, env) in corpus.CASES:
+        for cut in (1, 4):
+            before = interrupted(copy.deepcopy(prog), path, cut)
+            with output.use(output.ListSink()) as sink:
+                st = checkpoint.resume(str(path))
+            assert before + sink.lines == lines
+            assert corpus.plain(st[3]) == env
+
+
+def test_torn_record_is_ignored(tmp_path):
+    path = tmp_path / "run.ckpt"
+    interrupted(state(COUNTER)[1], path, 5)
+    good = checkpoint.read(str(path))
+    with open(path, "ab") as f:
+        f.write(b"D\x00\x00\x01")
+    assert checkpoint.read(str(path))[2] == good[2]
+
+
+def test_run_and_resume_with_checkpoints(tmp_path):
+    path = tmp_path / "run.ckpt"
+    expected = state(COUNTER)
+    lines = printed(rewrite, expected)
+    assert printed(checkpoint.run, state(COUNTER), str(path), 4, full_every=3) == lines
+    cont, env, steps, done = checkpoint.read(str(path))
+    assert done
+    assert env == expected[3]
+    assert type(env[("count",)]) is Actor
+
+    interrupted(state(COUNTER)[1], path, 3)
+    st = checkpoint.resume(str(path), every=5, full_every=2)
+    assert st[3] == expected[3]
+    assert checkpoint.read(str(path))[3]
+
+
+def test_unary_values_stay_small(tmp_path):
+    path = tmp_path / "big.ckpt"
+    source = COUNTER.replace('"aaaaaaaaaaaaaaaaaaaa"', '"' + "a" * 5000 + '"')
+    with output.use(output.NullSink()):
+        checkpoint.run(state(source), str(path), 1000)
+    # number's literal is written once; data, a rope as long, is one run.
+    assert path.stat().st_size < 6000
+    assert len(checkpoint.read(str(path))[1][("data",)][0]) == 5000
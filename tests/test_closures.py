@@ -0,0 +1,30 @@
+import corpus
+from helpers import DEFINE, EXPECTED, continued, printed, state
+
+from interpreter import closures, compiler
+from interpreter.core import rewrite, run
+
+
+def test_closures_run_the_corpus_like_rewrite():
+    assert corpus.check(closures.run) == []
+
+
+def test_state_moves_between_closures_and_other_engines():
+    _, env = continued([rewrite, rewrite, rewrite])
+    for engines in (
+        [closures.run, run, closures.run],
+        [run, closures.run, run],
+        [closures.run, compiler.run, closures.run],
+        [rewrite, closures.run, rewrite],
+    ):
+        lines, other = continued(engines)
+        assert lines == EXPECTED
+        assert other == env
+
+
+def test_closures_leave_core_actor_nodes_in_the_env():
+    st, core = state(DEFINE), state(DEFINE)
+    printed(closures.run, st)
+    printed(rewrite, core)
+    assert st[3][("x",)] == core[3][("x",)]
+    assert len(st[3][("x",)]) == 3
@@ -0,0 +1,59 @@
+import corpus
+from helpers import DEFINE, EXPECTED, continued, printed, program, state
+
+from interpreter import compiler
+from interpreter.core import rewrite, run
+
+def test_vm_runs_test_program_like_rewrite():
+    source = '''
+"" > data
+"aaaa" > number
+[
+  "step" => [ ["always" > @print] [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+    assert printed(compiler.run, state(source)) == printed(rewrite, state(source))
+
+
+def test_vm_runs_the_corpus_like_rewrite():
+    assert corpus.check(compiler.run) == []
+
+
+def test_state_moves_between_vm_and_core():
+    expected, env = continued([rewrite, rewrite, rewrite])
+    assert expected == EXPECTED
+    for engines in ([run, compiler.run, run], [compiler.run, run, compiler.run], [rewrite, compiler.run, rewrite]):
+        lines, other = continued(engines)
+        assert lines == EXPECTED
+        assert other == env
+
+
+def test_vm_leaves_core_actor_nodes_in_the_env():
+    st = state(DEFINE)
+    printed(compiler.run, st)
+    node = st[3][("x",)]
+    assert node[0] == "matchcases"
+    assert len(node) == 3
+    assert node[1][0][0] == ["hi"]
+    assert node[2] == [[["cmd"], ">", ["@", "print"]]]
+
+
+def test_names_resolve_to_slots_and_unwritten_names_fold():
+    code, scope = compiler.compile_program(program('"a" > x\n[x "b"] > y\n["b" c] > @y'), {})
+    assert scope.names == [("x",), ("y",)]
+    listing = compiler.disassemble(code, scope.names)
+    assert "LOAD_NAME 0 (('x',))" in listing
+    assert "STORE 1 (('y',))" in listing
+    assert "SEND 1 (('y',))" in listing
+    # c is never written, so it is a literal and ["b" c] one constant.
+    assert "LOAD_LIT ['bc']" in listing
+
+
+def test_vm_writes_slots_back_into_the_env():
+    env = {("x",): ["old"], ("unused",): ["kept"]}
+    st = state('[x "!"] > x\nx > y', env)
+    compiler.run(st)
+    assert env == {("x",): ["old!"], ("y",): ["old!"], ("unused",): ["kept"]}
@@ -0,0 +1,73 @@
+import copy
+
+import pytest
+
+import corpus
+from helpers import printed, state
+
+from interpreter import closures, compiler, output, transpiler
+from interpreter.core import execute, finished, load, pending, rewrite, run, step
+
+COUNTER = '''
+"" > data
+"aaaaaaaaaa" > number
+[
+  "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def test_stack_engine_runs_the_corpus_like_rewrite():
+    assert len(corpus.CASES) > 100
+    assert corpus.check(run) == []
+
+
+def test_rewrite_runs_the_corpus_like_step():
+    assert corpus.check(rewrite) == []
+
+
+def test_run_with_a_limit_can_be_resumed():
+    expected = state(COUNTER)
+    lines = printed(rewrite, expected)
+    st = state(COUNTER)
+    got = []
+    while not st[5]:
+        got += printed(run, st, limit=7)
+    assert got == lines
+    assert st[3] == expected[3]
+
+
+def test_pending_matches_the_program_step_would_hold():
+    # After each statement, the flattened continuation is the program
+    # step() has left.
+    for prog, _ in corpus.CASES[:40]:
+        cont = load(copy.deepcopy(prog))
+        ref = ["program", copy.deepcopy(prog), "env", {}, "done", False]
+        env = {}
+        with output.use(output.NullSink()):
+            while ref[1]:
+                ref, _ = step(ref)
+                assert execute(cont, env, limit=1) == 1
+                assert pending(cont) == ref[1]
+                assert finished(cont) == (not ref[1])
+        assert finished(cont)
+
+
+def test_tail_sends_run_in_constant_space():
+    st = state(COUNTER.replace('"aaaaaaaaaa"', '"' + "a" * 2000 + '"'))
+    cont = load(st[1])
+    deepest = 0
+    with output.use(output.NullSink()):
+        while execute(cont, st[3], limit=1):
+            deepest = max(deepest, len(cont[0]))
+    assert deepest <= 3
+
+
+@pytest.mark.parametrize("engine", [run, compiler.run, closures.run, transpiler.run], ids=["stack", "vm", "closure", "python"])
+def test_long_actor_loops_finish(engine):
+    st = state(COUNTER.replace('"aaaaaaaaaa"', '"' + "a" * 50000 + '"'))
+    assert printed(engine, st) == ["done"]
+    assert len(st[3][("data",)][0]) == 50000
@@ -0,0 +1,60 @@
+import random
+
+from helpers import printed, state
+
+from interpreter.core import Actor, eval_value, match_actor, new_node, rewrite, run
+from interpreter.hamt import Env
+
+
+def scan(env, actor, val):
+    for patres in env[tuple(actor)][1]:
+        if eval_value(patres[0], env) == val:
+            return patres
+    return None
+
+
+def test_index_answers_like_a_linear_scan():
+    rng = random.Random(2)
+    words = ["a", "b", "ab", "x", "y", ""]
+    for env in ({}, Env()):
+        pats = [[[[rng.choice(words)] for _ in range(rng.randint(1, 2))], [str(i)]] for i in range(60)]
+        env[("p",)] = new_node(pats, [])
+        for _ in range(300):
+            if rng.random() < 0.1:
+                # Binding a name makes the patterns that read it dynamic.
+                env[(rng.choice(words),)] = [rng.choice(words)]
+            if rng.random() < 0.1:
+                env[("p",)][1].append([[[rng.choice(words)]], ["late"]])
+            val = [rng.choice(words) for _ in range(rng.randint(1, 2))]
+            assert match_actor(env, ["p"], val) is scan(env, ["p"], val)
+
+
+def test_actor_read_as_a_value_has_only_its_items():
+    source = '''
+[ "hi" => [ ["got hi" > @print] ] ] > x
+x > y
+"hi" > @y
+y > z
+'''
+    for engine in (run, rewrite):
+        st = state(source)
+        assert printed(engine, st) == ["got hi"]
+        assert type(st[3][("x",)]) is Actor
+        assert list(st[3][("z",)]) == ["matchcases", st[3][("x",)][1], st[3][("x",)][2]]
+
+
+def test_first_matching_pattern_wins():
+    source = '''
+"b" > v
+[
+  "a" => [ ["first a" > @print] ]
+  v => [ ["dynamic" > @print] ]
+  "b" => [ ["literal b" > @print] ]
+  "a" => [ ["second a" > @print] ]
+] > p
+"a" > @p
+"b" > @p
+"c" > v
+"b" > @p
+'''
+    assert printed(run, state(source)) == printed(rewrite, state(source)) == ["first a", "dynamic", "literal b"]
@@ -0,0 +1,85 @@
+import random
+
+from helpers import printed, state
+
+from interpreter.core import rewrite, run
+from interpreter.hamt import Env, Map, popcount
+
+
+class Key:
+    # Hashes to one of a few values, so the trie builds Collision nodes.
+    def __init__(self, value):
+        self.value = value
+
+    def __hash__(self):
+        return self.value % 7
+
+    def __eq__(self, other):
+        return isinstance(other, Key) and other.value == self.value
+
+
+def test_popcount():
+    rnd = random.Random(0)
+    for x in [0, 1, 0xFFFFFFFF] + [rnd.getrandbits(32) for _ in range(1000)]:
+        assert popcount(x) == bin(x).count("1")
+
+
+def test_map_matches_dict_and_keeps_old_versions():
+    rnd = random.Random(1)
+    keys = [Key(i) for i in range(40)] + [(str(i),) for i in range(2000)]
+    m, d, versions = Map(), {}, []
+    for step in range(10000):
+        key, value = rnd.choice(keys), rnd.random()
+        m, d[key] = m.set(key, value), value
+        if step % 1000 == 0:
+            versions.append((m, dict(d)))
+    assert len(m) == len(d)
+    assert dict(m.items()) == d
+    for key in keys:
+        assert m.get(key) == d.get(key)
+        assert (key in m) == (key in d)
+    for old, expected in versions:
+        assert dict(old.items()) == expected
+        assert set(m.diff(old)) == {k for k in d if expected.get(k) is not d[k]}
+
+
+def test_set_same_value_returns_same_map():
+    m = Map().set(("a",), "x")
+    assert m.set(("a",), m.get(("a",))) is m
+
+
+def test_snapshot_restore_and_diff():
+    env = Env({("a",): ["1"]})
+    saved = env.snapshot()
+    env[("b",)] = ["2"]
+    env[("a",)] = ["3"]
+    assert sorted(env.snapshot().diff(saved)) == [("a",), ("b",)]
+    env.restore(saved)
+    assert env.items() == [(("a",), ["1"])]
+
+
+def test_fork_does_not_share_actor_definitions():
+    env = Env()
+    run(state('[ "a" => [["A" > @print]] ] > x\n"a" > @x', env))
+    fork = env.fork()
+    assert printed(run, state('[ "b" => [["B" > @print]] ] > x\n"b" > @x', fork)) == ["B"]
+    assert len(env[("x",)][1]) == 1
+    assert len(fork[("x",)][1]) == 2
+    assert printed(run, state('"b" > @x\n"a" > @x', env)) == ["A"]
+
+
+def test_engines_run_on_env_like_dict():
+    source = '''
+"" > data
+"aaaa" > number
+[
+  "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+    env = Env()
+    expected = state(source)
+    assert printed(run, state(source, env)) == printed(rewrite, expected)
+    assert dict(env.items()) == expected[3]
@@ -0,0 +1,64 @@
+import pytest
+
+import corpus
+from helpers import printed, state
+
+from interpreter import output
+from interpreter.core import rewrite, run, step
+from interpreter.hooks import Hooks
+
+COUNTER = '''
+"" > data
+"aaa" > number
+[
+  "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def test_hooked_runs_match_rewrite_on_the_corpus():
+    hooks = Hooks()
+    hooks.on("statement", lambda stmt, env: None)
+    assert corpus.check(run, hooks=hooks) == []
+    assert corpus.check(rewrite, hooks=hooks) == []
+
+
+def test_events():
+    hooks = Hooks()
+    events = []
+    hooks.on("write", lambda key, value: events.append(("write", key)))
+    hooks.on("send", lambda name, val: events.append(("send", name, val)))
+    hooks.on("done", lambda env: events.append(("done",)))
+
+    @hooks.on("match")
+    def matched(name, val, pat, result):
+        events.append(("match", name, val))
+
+    statements = []
+    hooks.on("statement", lambda stmt, env: statements.append(stmt))
+    st = state(COUNTER)
+    assert printed(run, st, hooks=hooks) == printed(rewrite, state(COUNTER))
+    assert events[:4] == [("write", ("data",)), ("write", ("number",)), ("write", ("count",)), ("send", "count", ["step"])]
+    assert events[4] == ("match", "count", ["step"])
+    assert [e for e in events if e[0] == "match"][-1] == ("match", "count", ["aaa"])
+    assert events[-1] == ("done",)
+    ref, steps = state(COUNTER), 0
+    with output.use(output.NullSink()):
+        while ref[1]:
+            ref, _ = step(ref)
+            steps += 1
+    assert len(statements) == steps
+
+
+def test_off_and_unknown_events():
+    hooks = Hooks()
+    assert not hooks
+    fn = hooks.on("send", lambda name, val: None)
+    assert hooks
+    hooks.off("send", fn)
+    assert not hooks
+    with pytest.raises(Exception, match="unknown hook event"):
+        hooks.on("print", fn)
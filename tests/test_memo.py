@@ -0,0 +1,47 @@
+import corpus
+from helpers import printed, state
+
+from interpreter.core import rewrite, run
+from interpreter.memo import EvalCache
+
+COUNTER = '''
+"" > data
+"aaaaaaaaaa" > number
+[
+  "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def memo_run(state):
+    return run(state, cache=EvalCache())
+
+
+def test_memoized_runs_match_rewrite_on_the_corpus():
+    assert corpus.check(memo_run) == []
+
+
+def test_values_are_recomputed_only_after_their_keys_change():
+    cache = EvalCache()
+    st = state(COUNTER)
+    assert printed(run, st, cache=cache) == printed(rewrite, state(COUNTER)) == ["done"]
+    stats = cache.stats()
+    # The literal "step" and the unchanged number are served from the cache.
+    assert stats["hits"] > 0
+    assert stats["hits"] + stats["misses"] > stats["entries"]
+
+
+def test_touch_invalidates_only_readers_of_the_key():
+    cache = EvalCache()
+    env = {("a",): ["1"], ("b",): ["2"]}
+    reads_a, reads_b = [["a"], ["x"]], [["b"]]
+    assert cache.eval(reads_a, env) == ["1x"]
+    assert cache.eval(reads_b, env) == ["2"]
+    env[("a",)] = ["3"]
+    cache.touch(("a",))
+    assert cache.eval(reads_a, env) == ["3x"]
+    assert cache.eval(reads_b, env) == ["2"]
+    assert (cache.hits, cache.misses) == (1, 3)
@@ -0,0 +1,51 @@
+import sys
+
+from helpers import printed, state
+
+from interpreter import memreport
+from interpreter.core import rewrite
+from interpreter.values import Rope
+
+COUNTER = '''
+"" > data
+"aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa" > number
+[
+  "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def test_deep_size_counts_shared_objects_once():
+    inner = ["x" * 100]
+    twice = memreport.deep_size([inner, inner]) - memreport.deep_size([inner])
+    assert twice == sys.getsizeof([inner, inner]) - sys.getsizeof([inner])
+    rope = Rope.of("a" * 1000).append("b")
+    assert memreport.deep_size(rope) < 1000
+
+
+def test_report_samples_a_run():
+    report = memreport.MemoryReport(every=20)
+    st, expected = state(COUNTER), state(COUNTER)
+    assert printed(memreport.run, st, report, trace_allocations=False) == printed(rewrite, expected)
+    assert st[3] == expected[3]
+    assert report.samples == report.steps // 20 + 2
+    first, first_step, peak, last, last_step = report.entries[("data",)]
+    # Not bound yet at the first sample, before any statement ran.
+    assert first_step == 20 and last_step == report.steps
+    assert peak == last > first
+    patterns, commands = report.actors[("count",)][:2]
+    assert (patterns, commands) == (2, 1)
+    text = report.report()
+    assert text.startswith(f"memory: {report.samples} samples every 20 statements")
+    assert "count (actor)" in text
+    assert "traced memory" not in text
+
+
+def test_report_traces_allocations():
+    report = memreport.MemoryReport(every=50)
+    printed(memreport.run, state(COUNTER), report)
+    assert report.traced_peak > 0
+    assert "traced memory: peak" in report.report()
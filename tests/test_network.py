@@ -0,0 +1,95 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from helpers import printed, state
+
+from interpreter import network
+from interpreter.core import rewrite
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_values_and_batches_round_trip():
+    val = ["a", ["b", [], ["ü"]], "c" * 300]
+    payload = network.pack_value(val)[network.HEADER.size :]
+    assert network.get_value(payload, 0) == (val, len(payload))
+    msgs = [("x", ["1"]), ("y", [["2"], "3"])]
+    assert network.unpack_batch(network.pack_batch(msgs)[network.HEADER.size :]) == msgs
+
+
+def test_local_actors_need_no_registry():
+    source = '''
+"" > data
+"aaaa" > number
+[
+  "step" => [ ["always" > @print] [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+    assert printed(network.run, state(source), linger=0) == printed(rewrite, state(source))
+
+
+def test_send_to_unknown_name_without_registry_fails():
+    with pytest.raises(Exception, match="no registry"):
+        network.run(state('"x" > @nobody\n"a" > @print'), linger=0)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def arrow(tmp_path, name, source, *args):
+    path = tmp_path / name
+    path.write_text(source)
+    return subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "arrow.py"), "--engine", "network", *args, str(path)],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+
+
+def test_nodes_in_separate_processes(tmp_path):
+    port = free_port()
+    registry = subprocess.Popen(
+        [sys.executable, "-m", "interpreter.network", str(port)],
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                assert time.monotonic() < deadline, "registry did not start"
+                time.sleep(0.05)
+        address = f"127.0.0.1:{port}"
+        peer = arrow(
+            tmp_path,
+            "peer.ar",
+            '[ "ping" => [ ["peer got ping" > @print] ["pong" > @home] ] ] > peer\n"ready" > status\n',
+            "--registry", address, "--linger", "5",
+        )
+        home = arrow(
+            tmp_path,
+            "home.ar",
+            '[ "pong" => [ ["home got pong" > @print] ] ] > home\n"ping" > @peer\n',
+            "--registry", address, "--linger", "1",
+        )
+        assert home.communicate(timeout=30)[0] == "home got pong\n"
+        assert peer.communicate(timeout=30)[0] == "peer got ping\n"
+    finally:
+        registry.kill()
+        registry.wait()
+
@@ -0,0 +1,50 @@
+import pytest
+
+from helpers import printed, state
+
+from interpreter import closures, compiler, output
+from interpreter.core import rewrite, run
+
+
+def test_sink_needs_emit():
+    with pytest.raises(TypeError):
+        output.Sink()
+
+
+def test_list_sink_splits_writes_into_lines():
+    with output.use(output.ListSink()) as sink:
+        output.write("a\nb\n")
+        output.write("c")
+        output.write("d\n")
+        output.write("e")
+    assert sink.lines == ["a", "b", "cd", "e"]
+
+
+def test_file_sink_emits_full_buffers(tmp_path):
+    path = tmp_path / "out.txt"
+    sink = output.FileSink(str(path), buffer=10)
+    sink.write("abc\n")
+    assert sink.parts == ["abc\n"]
+    sink.write("defghij\n")
+    assert sink.parts == []
+    sink.write("k\n")
+    sink.close()
+    assert path.read_text() == "abc\ndefghij\nk\n"
+
+
+def test_null_sink_and_use_restores_the_sink():
+    old = output.sink
+    with output.use(output.NullSink()):
+        output.write("gone\n")
+        assert output.sink is not old
+    assert output.sink is old
+
+
+def test_open_sink():
+    assert isinstance(output.open_sink("stdout"), output.StdoutSink)
+    assert isinstance(output.open_sink("null"), output.NullSink)
+
+
+@pytest.mark.parametrize("engine", [run, rewrite, compiler.run, closures.run])
+def test_engines_print_through_the_current_sink(engine):
+    assert printed(engine, state('"a" > x\n[x "b"] > @print\n"c" > @print')) == ["ab", "c"]
@@ -0,0 +1,60 @@
+import pytest
+
+from helpers import program
+
+from interpreter.parser import (
+    ARROW, CLOSE, COMMA, OPEN, SEND, STRING, WORD, desugar, parse, tokenize,
+)
+
+SOURCE = 'a > ["b c", x] # c\n=> @p'
+
+
+def test_tokens_are_kinds_and_offsets():
+    tokens = tokenize(SOURCE)
+    assert tokens.kinds.typecode == "B"
+    assert list(tokens.kinds) == [WORD, SEND, OPEN, STRING, COMMA, WORD, CLOSE, ARROW, WORD]
+    assert list(tokens.starts) == [0, 2, 4, 5, 10, 12, 13, 19, 22]
+    assert list(tokens.ends) == [1, 3, 5, 10, 11, 13, 14, 21, 24]
+    assert len(tokens) == 9
+
+
+def test_token_text_is_sliced_on_demand():
+    tokens = tokenize(SOURCE)
+    assert list(tokens) == ["a", ">", "[", '"b c"', ",", "x", "]", "=>", "@p"]
+    assert tokens[3] == '"b c"'
+    assert tokens[-1] == "@p"
+    assert tokens[1:3] == [">", "["]
+
+
+def test_whitespace_and_comments_are_skipped():
+    assert list(tokenize("  \n\t")) == []
+    assert list(tokenize("# all comment\n  a # trailing\n")) == ["a"]
+    assert list(tokenize('"# not a comment"')) == ['"# not a comment"']
+
+
+def test_unterminated_string():
+    with pytest.raises(Exception, match="Unterminated string literal"):
+        tokenize('a > "x')
+    with pytest.raises(Exception, match="Unterminated string literal"):
+        parse('"x')
+
+
+def test_parse_nests_brackets():
+    assert parse(SOURCE) == ["a", ">", ['"b c"', "x"], "=>", "@p"]
+    # Anything after an unmatched closing bracket is ignored.
+    assert parse("a ] b") == ["a"]
+    with pytest.raises(Exception, match="Expected ']'"):
+        parse("[a")
+
+
+def test_desugar_and_group_statements():
+    assert desugar(parse('"a" > @p, [b] > c')) == [["a"], ">", ["@", "p"], [["b"]], ">", ["c"]]
+    assert program('"a" > x ["a" => [["y" > @print]]] > p') == [
+        [["a"], ">", ["x"]],
+        [[[["a"], "=>", [[["y"], ">", ["@", "print"]]]]], ">", ["p"]],
+    ]
+
+
+def test_large_sources_parse_like_their_parts():
+    part = '"a b" > x  # note\n[ "a b" => [[x > @print]] ] > p\nx > @p\n'
+    assert program(part * 20000) == program(part) * 20000
@@ -0,0 +1,68 @@
+import json
+
+import corpus
+from helpers import printed, state
+
+from interpreter import profile
+from interpreter.core import rewrite
+
+COUNTER = '''
+"" > data
+"aaaaa" > number
+[
+  "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def profiled(st):
+    return profile.run(st, profile.Profile())
+
+
+def test_profiled_runs_match_rewrite_on_the_corpus():
+    assert corpus.check(profiled) == []
+
+
+def test_counts_statements_and_actor_traffic():
+    stats = profile.Profile()
+    st = state(COUNTER)
+    assert printed(profile.run, st, stats) == printed(rewrite, state(COUNTER))
+    # "step" is sent by the program and by the four queued commands, and
+    # matches each time; data "a" ... "aaaa" match nothing and queue the
+    # command, and "aaaaa" matches.
+    received, compared, matched, enqueued = stats.actors["count"]
+    assert received == 10
+    assert matched == 6
+    assert enqueued == 5 * 2 + 4 + 1
+    assert compared > 0
+    counts = {}
+    for stmt, count, _ in stats.statements.values():
+        # The program's "step" > @count and the actor's command look alike.
+        counts[profile.show(stmt)] = counts.get(profile.show(stmt), 0) + count
+    assert counts["data > @count"] == 5
+    assert counts["step > @count"] == 5
+    assert sum(counts.values()) == stats.steps
+
+
+def test_report_and_json():
+    stats = profile.Profile()
+    printed(profile.run, state(COUNTER), stats)
+    report = stats.report()
+    assert report.startswith(f"{stats.steps} statements in ")
+    assert "count" in report
+    data = json.loads(json.dumps(stats.to_json()))
+    assert data["steps"] == stats.steps
+    assert data["actors"]["count"]["received"] == 10
+
+
+def test_limited_profiled_run_can_be_resumed():
+    stats = profile.Profile()
+    st = state(COUNTER)
+    lines = []
+    while not st[5]:
+        lines += printed(profile.run, st, stats, limit=4)
+    assert lines == ["done"]
+    assert stats.actors["count"][0] == 10
@@ -0,0 +1,83 @@
+import pytest
+
+from helpers import printed, state
+
+from interpreter import output
+from interpreter.core import rewrite
+from interpreter.scheduler import Scheduler
+
+COUNTER = '''
+"" > data
+"aaaaaaaaaa" > number
+[
+  "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+FOREVER = '''
+[ "go" => [ ["go" > @loop] ] ] > loop
+"go" > @loop
+'''
+
+
+def test_jobs_finish_like_separate_runs():
+    sched = Scheduler(quantum=3)
+    states = [state(COUNTER), state(COUNTER.replace("aaaaaaaaaa", "aaa")), state('"x" > @print\n"y" > z')]
+    for st in states:
+        sched.add(st)
+    with output.use(output.ListSink()) as sink:
+        jobs = sched.run()
+    assert [job.error for job in jobs] == [None, None, None]
+    assert all(st[5] for st in states)
+    assert sorted(sink.lines) == ["done", "done", "x"]
+    for st, source in zip(states, (COUNTER, COUNTER.replace("aaaaaaaaaa", "aaa"))):
+        expected = state(source)
+        printed(rewrite, expected)
+        assert st[3] == expected[3]
+
+
+def test_step_limit_stops_a_runaway_job_only():
+    sched = Scheduler(quantum=10)
+    loop = sched.add(state(FOREVER), "loop", max_steps=1000)
+    counter = sched.add(state(COUNTER), "counter")
+    with output.use(output.ListSink()) as sink:
+        sched.run()
+    assert loop.steps == 1000
+    assert "step limit of 1000 reached" in str(loop.error)
+    assert not loop.state[5]
+    # The rest of its program stays in the state.
+    assert loop.state[1]
+    assert counter.error is None and counter.state[5]
+    assert sink.lines == ["done"]
+
+
+def test_weights_share_the_steps():
+    sched = Scheduler(quantum=10)
+    light = sched.add(state(FOREVER), "light", max_steps=100000)
+    heavy = sched.add(state(FOREVER), "heavy", weight=3, max_steps=100000)
+    with output.use(output.NullSink()):
+        for _ in range(400):
+            sched.tick()
+    assert heavy.steps / light.steps == pytest.approx(3, rel=0.1)
+
+
+def test_errors_end_only_their_job():
+    sched = Scheduler()
+    broken = state('"a" > x\n"b" > y')
+    broken[1].append(["too short"])
+    bad = sched.add(broken, "bad")
+    good = sched.add(state(COUNTER), "good")
+    with output.use(output.NullSink()):
+        sched.run()
+    assert bad.error is not None
+    assert good.error is None and good.state[5]
+
+
+def test_invalid_settings():
+    with pytest.raises(Exception):
+        Scheduler(quantum=0)
+    with pytest.raises(Exception):
+        Scheduler().add(state(COUNTER), weight=0)
@@ -0,0 +1,48 @@
+from helpers import printed, state
+
+from interpreter import sharding
+from interpreter.core import rewrite
+
+COUNTER = '''
+"" > data
+"aaaa" > number
+[
+  "step" => [ ["always" > @print] [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+# ping and left live on different shards of two.
+RELAY = '''
+[ "1" => [ ["ping 1" > @print] ["2" > @left] ] "3" => [ ["ping 3" > @print] ["4" > @left] ] ] > ping
+[ "2" => [ ["left 2" > @print] ["3" > @ping] ] "4" => [ ["left 4" > @print] ] ] > left
+"1" > @ping
+"start" > @print
+'''
+
+
+def test_relay_crosses_shards():
+    assert sharding.shard_of("ping", 2) != sharding.shard_of("left", 2)
+    # The top-level program runs before any message is handled.
+    expected = ["start", "ping 1", "left 2", "ping 3", "left 4"]
+    assert sorted(printed(rewrite, state(RELAY))) == sorted(expected)
+    assert printed(sharding.run, state(RELAY), workers=2, deterministic=True) == expected
+    assert printed(sharding.run, state(RELAY), workers=2) == expected
+
+
+def test_actor_writes_are_merged_back_into_the_env():
+    for deterministic in (True, False):
+        st, expected = state(COUNTER), state(COUNTER)
+        assert printed(sharding.run, st, workers=3, deterministic=deterministic) == printed(rewrite, expected)
+        assert st[3] == expected[3]
+        assert st[5]
+
+
+def test_deterministic_runs_repeat():
+    source = RELAY + "\n".join(f'"{n}" > @ping' for n in "13") + "\n"
+    first = printed(sharding.run, state(source), workers=2, deterministic=True)
+    assert len(first) == 11
+    for _ in range(3):
+        assert printed(sharding.run, state(source), workers=2, deterministic=True) == first
@@ -0,0 +1,86 @@
+import pickle
+
+from helpers import printed, state
+
+from interpreter import sharding, shm
+from interpreter.core import new_node, rewrite
+from interpreter.values import Rope
+
+
+def test_export_and_load_round_trip():
+    store = shm.SharedValues(0, threshold=100)
+    big = "x" * 50 + "y" * 100
+    rope = Rope.of("ab" * 100).append("c" * 10**6)
+    val = ["small", big, [rope, "tail"]]
+    try:
+        exported = store.export(val)
+        assert exported[0] == "small"
+        assert isinstance(exported[1], shm.Handle)
+        assert isinstance(exported[2][0], shm.Handle)
+        # Only the handles are pickled: the rope's runs, not its million characters.
+        assert len(pickle.dumps(exported)) < 1000
+        released = []
+        loaded = shm.load(pickle.loads(pickle.dumps(exported)), released)
+        assert loaded == val
+        assert list(loaded[2][0].iter_runs()) == [("ab" * 100, 1), ("c", 10**6)]
+        assert sorted(released) == sorted([(0, exported[1].name), (0, exported[2][0].name)])
+    finally:
+        store.close()
+
+
+def test_unary_ropes_are_pickled_as_runs():
+    # A few characters of runs, however long the rope.
+    assert not shm.is_large(Rope.of("a" * 10**6).append("b"), threshold=100)
+
+
+def test_sending_the_same_string_again_reuses_its_segment():
+    store = shm.SharedValues(0, threshold=10)
+    big = "z" * 20
+    try:
+        first, second = store.export([big]), store.export([big])
+        assert first[0].name == second[0].name
+        assert len(store.segments) == 1
+        store.release(first[0].name)
+        assert len(store.segments) == 1
+        store.release(second[0].name)
+        assert store.segments == {}
+    finally:
+        store.close()
+
+
+def test_segments_held_by_the_env_live_until_overwritten():
+    store = shm.SharedValues(0, threshold=10)
+    big = "z" * 20
+    try:
+        handle = store.export([big])[0]
+        store.written(None, [big])
+        store.release(handle.name)
+        assert len(store.segments) == 1
+        store.written([big], ["small"])
+        assert store.segments == {}
+    finally:
+        store.close()
+
+
+def test_actor_nodes_keep_their_type():
+    store = shm.SharedValues(0, threshold=10)
+    try:
+        node = new_node([[["p" * 20], [["x"], ">", ["y"]]]], [])
+        loaded = shm.load(store.export(node), [])
+        assert type(loaded) is type(node)
+        assert loaded == node
+    finally:
+        store.close()
+
+
+def test_large_values_cross_shards():
+    n = shm.THRESHOLD * 2
+    source = f'''
+"{"ab" * n}" > big
+[ "go" => [ [big > @left] ] ] > ping
+[ [big] => [ ["left got big" > @print] ] ] > left
+"go" > @ping
+'''
+    assert sharding.shard_of("ping", 2) != sharding.shard_of("left", 2)
+    expected = printed(rewrite, state(source))
+    assert printed(sharding.run, state(source), workers=2, deterministic=True) == expected == ["left got big"]
@@ -0,0 +1,46 @@
+from helpers import EXPECTED, continued, printed, state
+
+from interpreter import threads
+from interpreter.core import rewrite, run
+
+
+def test_threads_run_like_rewrite():
+    source = '''
+"" > data
+"aaaa" > number
+[
+  "step" => [ ["always" > @print] [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+    assert printed(threads.run, state(source), threads=4) == printed(rewrite, state(source))
+
+
+def test_send_before_the_actor_is_defined_is_dropped():
+    # The one pool thread is kept busy by y while x is defined.
+    source = '''
+"" > n
+"aaaaaaaaaaaaaaaaaaaaaaaaaaaaaa" > stop
+[
+  "step" => [ [[n "a"] > n] [n > @y] ]
+  [stop] => [ ["y done" > @print] ]
+  "step" > @y
+] > y
+"step" > @y
+"early" > @x
+[ "early" => [ ["got early" > @print] ] ] > x
+'''
+    assert printed(threads.run, state(source), threads=1, batch=1000) == printed(rewrite, state(source))
+
+
+def test_state_moves_between_threads_and_core():
+    _, env = continued([rewrite, rewrite, rewrite])
+    lines, other = continued([threads.run, run, threads.run])
+    assert other == env
+    # Actors run alongside the program, so the last part may print n
+    # before x has handled its message.
+    n = [line for line in lines if line.startswith("a")]
+    assert len(n) == 1
+    assert sorted(line for line in lines if line not in n) == sorted(EXPECTED[:-1])
@@ -0,0 +1,57 @@
+import copy
+
+import pytest
+
+import corpus
+from helpers import printed, state
+
+from interpreter import output, trace
+from interpreter.core import rewrite, step
+
+
+def test_replay_reaches_every_step_of_the_run(tmp_path):
+    path = str(tmp_path / "run.trace")
+    for prog, (lines, env) in corpus.CASES:
+        st = ["program", copy.deepcopy(prog), "env", {}, "done", False]
+        with output.use(output.ListSink()) as sink:
+            trace.record(st, path, keyframe_every=5)
+        assert sink.lines == lines
+        assert corpus.plain(st[3]) == env
+        ref = ["program", copy.deepcopy(prog), "env", {}, "done", False]
+        n = 0
+        with output.use(output.NullSink()):
+            while True:
+                replayed = trace.replay(path, n)
+                assert replayed[1] == ref[1]
+                assert corpus.plain(replayed[3]) == corpus.plain(ref[3])
+                if not ref[1]:
+                    break
+                ref, _ = step(ref)
+                n += 1
+        final = trace.replay(path)
+        assert final[5] and corpus.plain(final[3]) == env
+
+
+def test_replay_past_the_end_fails(tmp_path):
+    path = str(tmp_path / "run.trace")
+    with output.use(output.NullSink()):
+        trace.record(state('"a" > x\n"b" > y'), path)
+    assert trace.replay(path, 2)[3] == {("x",): ["a"], ("y",): ["b"]}
+    with pytest.raises(Exception, match="ends at step 2"):
+        trace.replay(path, 3)
+
+
+def test_recording_does_not_change_the_run(tmp_path):
+    source = '''
+"" > data
+"aaaaaaaaaa" > number
+[
+  "step" => [ [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+    st, expected = state(source), state(source)
+    assert printed(trace.record, st, str(tmp_path / "run.trace"), 7) == printed(rewrite, expected)
+    assert st[3] == expected[3]
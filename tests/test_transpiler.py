@@ -0,0 +1,52 @@
+import os
+
+import corpus
+from helpers import printed, state
+
+from interpreter import output, transpiler
+from interpreter.core import rewrite
+
+SOURCE = '''
+"" > data
+"aaaa" > number
+[
+  "step" => [ ["always" > @print] [[data "a"] > data] [data > @count] ]
+  [number] => [ ["done" > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+
+
+def test_python_engine_runs_like_rewrite():
+    assert printed(transpiler.run, state(SOURCE)) == printed(rewrite, state(SOURCE))
+
+
+def test_python_engine_runs_the_corpus_like_rewrite():
+    assert corpus.check(transpiler.run) == []
+
+
+def run_cached(path):
+    with output.use(output.ListSink()) as sink:
+        transpiler.cached_module(str(path)).main(None, output.sink)
+    return sink.lines
+
+
+def test_cache_keeps_one_module_per_source(tmp_path):
+    prog, other = tmp_path / "prog.ar", tmp_path / "prog2.ar"
+    cache = tmp_path / "__arrowcache__"
+    other.write_text('"other" > @print\n"x" > y\n')
+    run_cached(other)
+    prog.write_text(SOURCE)
+    assert run_cached(prog) == printed(rewrite, state(SOURCE))
+    first = sorted(os.listdir(cache))
+    assert run_cached(prog) == printed(rewrite, state(SOURCE))
+    assert sorted(os.listdir(cache)) == first
+    prog.write_text('"changed" > @print\n"x" > y\n')
+    assert run_cached(prog) == ["changed"]
+    names = sorted(os.listdir(cache))
+    assert len(names) == 2
+    assert [name for name in names if name.startswith("prog2.")] == [
+        name for name in first if name.startswith("prog2.")
+    ]
+    assert not set(names) & {name for name in first if name.startswith("prog.")}
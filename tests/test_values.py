@@ -0,0 +1,75 @@
+import random
+
+from helpers import printed, state
+
+from interpreter.core import rewrite, run
+from interpreter.values import ROPE_MIN, Rope, concat, text
+
+
+def test_short_concatenations_stay_str():
+    assert type(concat("ab", "cd")) is str
+    assert type(concat("a" * ROPE_MIN, "b")) is Rope
+
+
+def test_ropes_equal_and_hash_like_their_characters():
+    rng = random.Random(3)
+    for _ in range(200):
+        parts = ["".join(rng.choice("abc") for _ in range(rng.randint(0, 300))) for _ in range(rng.randint(1, 8))]
+        rope, flat = Rope.of(""), ""
+        for part in parts:
+            rope, flat = concat(rope, part), flat + part
+        assert len(rope) == len(flat)
+        assert rope == flat and flat == rope
+        assert not rope != flat
+        assert hash(rope) == hash(flat)
+        assert {flat: 1}[rope] == 1
+        assert text([rope, "!"]) == flat + "!"
+        assert rope == Rope.of(flat)
+
+
+def test_ropes_never_see_each_others_appends():
+    base = Rope.of("x" * ROPE_MIN).append("y")
+    left = base.append("left")
+    right = base.append("right")
+    assert str(base) == "x" * ROPE_MIN + "y"
+    assert str(left) == "x" * ROPE_MIN + "yleft"
+    assert str(right) == "x" * ROPE_MIN + "yright"
+    assert str(left + right) == str(left) + str(right)
+
+
+def test_growing_variables_print_like_rewrite():
+    n = ROPE_MIN * 3
+    source = f'''
+"" > data
+"{'ab' * n}" > number
+[
+  "step" => [ [[data "ab"] > data] [data > @count] ]
+  [number] => [ [data > @print] ]
+  "step" > @count
+] > count
+"step" > @count
+'''
+    st = state(source)
+    assert printed(run, st) == printed(rewrite, state(source)) == ["ab" * n]
+    assert type(st[3][("data",)][0]) is Rope
+
+
+def test_unary_numbers_are_one_run():
+    n = 10**7
+    rope = Rope.of("a" * ROPE_MIN)
+    for _ in range(100):
+        rope = rope.append("a" * (n // 100))
+    assert len(rope) == n + ROPE_MIN
+    assert list(rope.iter_runs()) == [("a", n + ROPE_MIN)]
+    assert rope.flat is None
+    assert rope == "a" * (n + ROPE_MIN)
+    assert rope != "a" * (n + ROPE_MIN - 1) + "b"
+    # Compared without building the string.
+    assert rope.flat is None
+
+
+def test_runs_of_different_characters():
+    rope = Rope.of("a" * 300).append("b", 5).append("a", 2)
+    assert list(rope.iter_runs()) == [("a", 300), ("b", 5), ("a", 2)]
+    assert rope == "a" * 300 + "bbbbb" + "aa"
+    assert rope == Rope.of("a" * 300 + "bbbbb" + "aa")